@@ -1,13 +1,60 @@
-import panel as pn
-from assistant.app import AssistantApp
+import argparse
 
+from utils.log_utils import configure_logging
+
+# Startup paths, profiled separately: the Panel server and the headless (graph only) one
+PROFILED_MODULES = ['assistant.inf_graph_todo', 'assistant.app']
+
+
+def profile_startup() -> None:
+    from utils.startup_profiler import StartupProfiler
+
+    profiler = StartupProfiler()
+    for module_name in PROFILED_MODULES:
+        profiler.profile_imports(module_name)
+
+    with profiler.measure('import assistant.app'):
+        import panel as pn
+        from assistant.app import AssistantApp
+    from assistant.inf_graph_todo import get_graph
+    with profiler.measure('get_graph()'):
+        get_graph()
+    with profiler.measure('pn.extension()'):
+        pn.extension()
+    with profiler.measure('AssistantApp()'):
+        AssistantApp()
+    print(profiler.report())
+
+
+def serve() -> None:
+    import panel as pn
+    from assistant.app import AssistantApp
 
-if __name__ == '__main__':
     # 1) Initialize Panel
     pn.extension()
 
-    # 2) Instantiate your custom app
-    app = AssistantApp()
+    # 2) Instantiate your custom app per browser session, each with a conversation thread of its own
+    def create_session_app() -> pn.Column:
+        return AssistantApp(thread_id=pn.state.curdoc.session_context.id).get_dashboard()
 
     # 3) Serve the dashboard
-    pn.serve(app.get_dashboard(), port=5006, allow_websocket_origin=['*'], show=True)
+    pn.serve(create_session_app, port=5006, allow_websocket_origin=['*'], show=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AToDo agentic app')
+    parser.add_argument(
+        '--profile-startup', action='store_true',
+        help='report import and initialization cost of each module, then exit'
+    )
+    parser.add_argument(
+        '--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='level of the app log: INFO shows prompt tokens per section and Trustcall repair rounds per update'
+    )
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.profile_startup:
+        profile_startup()
+    else:
+        serve()
@@ -1,15 +1,18 @@
 from collections import namedtuple
 from datetime import datetime, timedelta
+from functools import partial
 
 import panel as pn
 from langchain_core.messages import HumanMessage
-from langchain_openai import OpenAI
 from param.parameterized import Event
 
 from assistant.graph_visualizer import GraphVisualizer, NodeColorizer
-from assistant.inf_graph_todo import graph as graph_todo, route_listeners, across_thread_memory
+from assistant.inf_graph_todo import (
+    get_graph, route_listeners, get_across_thread_memory, memory_change_listeners, MemoryChangeListener
+)
+from assistant.inspector import ChangeEvent
+from assistant.reminders import ReminderListener, reminder_listeners
 from assistant.models import Configuration, MemoryType
-from utils.fs_utils import load_api_key
 
 PAGE_NAME_CHAT = 'Chat'
 PAGE_NAME_DETAILS = 'Details'
@@ -19,33 +22,57 @@ TAB_TODO = 'mem: ToDos'
 TAB_INSTRUCTIONS = 'mem: Instructions'
 
 EMPTY_JSON = {}
+MSG_SETTINGS = dict(
+    show_avatar=True, show_user=False, show_timestamp=True, show_copy_icon=False, show_edit_icon=False, reaction_icons={}
+)
+AVATARS = {'user': chr(0xC6C3), 'ai': chr(0x2728), 'reminder': chr(0x23F0)}
+
+# The chat feed keeps at most this many live message widgets; older ones are re-created from the checkpoint on demand
+MAX_LIVE_MESSAGES = 30
+HISTORY_PAGE_SIZE = 10
+
 MockEvent = namedtuple(typename='MockEvent', field_names=['name', 'old', 'new'])
 
 class AssistantApp:
-    def __init__(self) -> None:
-        self.llm = OpenAI(api_key=load_api_key('openai.api_key'))
-        self.conversation_thread = {'configurable': {'thread_id': '1'}}
+    def __init__(self, thread_id: str = '1') -> None:
+        self.conversation_thread = {'configurable': {'thread_id': thread_id}}
+        self.user_id = Configuration.from_runnable_config(self.conversation_thread).user_id
 
         # -----------------------------
         # Construct main page
         # -----------------------------
         self.chat_feed = pn.chat.ChatFeed()
+        self.history_start = 0  # index in the transcript of the oldest live message
+        self.history_at_latest = True
+        self.btn_load_earlier = pn.widgets.Button(
+            name='Load earlier messages', button_type='default', button_style='outline', visible=False
+        )
+        self.btn_load_earlier.on_click(self.load_earlier_messages)
+        self.btn_load_latest = pn.widgets.Button(
+            name='Show latest messages', button_type='default', button_style='outline', visible=False
+        )
+        self.btn_load_latest.on_click(self.load_latest_messages)
         self.chat_input = pn.chat.ChatAreaInput()
         self.chat_input.param.watch(self.submit_message_action, 'value')
         self.btn_simulate_conv = pn.widgets.Button(
             name='Simulate conversation', button_type='default', button_style='outline'
         )
         self.btn_simulate_conv.on_click(self.simulate_conversation)
+        self.deadline_reminder = DeadlineReminder(self)
+        reminder_listeners.add(self.deadline_reminder)
 
         self.chat_interface = pn.Column(
+            self.btn_load_earlier,
             self.chat_feed,
+            self.btn_load_latest,
             pn.Row(self.chat_input, self.btn_simulate_conv),
             sizing_mode='stretch_both',
             styles={'border': '1px solid black', 'padding': '10px', 'border-radius': '5px'},
         )
 
-        self.graph_visualizer = GraphVisualizer(graph_todo)
-        route_listeners.add(NodeColorizer(self.graph_visualizer))
+        self.graph_visualizer = GraphVisualizer(get_graph())
+        self.node_colorizer = NodeColorizer(self.graph_visualizer, thread_id=thread_id)
+        route_listeners.add(self.node_colorizer)
 
         self.panel_main = pn.Row(
             self.chat_interface,
@@ -68,6 +95,8 @@ class AssistantApp:
             dynamic=True
         )
         self.tabs_details.param.watch(self.on_details_change, 'active')
+        self.memory_editor_refresher = MemoryEditorRefresher(self)
+        memory_change_listeners.add(self.memory_editor_refresher)
 
         self.panel_details = pn.Column(
             self.tabs_details,
@@ -95,6 +124,15 @@ class AssistantApp:
             self.panel_details
         )
 
+        # listeners of a served session go away with it; an app created outside a session lives as long as the process
+        if pn.state.curdoc and pn.state.curdoc.session_context:
+            pn.state.on_session_destroyed(self.on_session_destroyed)
+
+    def on_session_destroyed(self, session_context) -> None:
+        memory_change_listeners.discard(self.memory_editor_refresher)
+        reminder_listeners.discard(self.deadline_reminder)
+        route_listeners.discard(self.node_colorizer)
+
     def on_navigation_change(self, event: Event):
         if event.new == PAGE_NAME_CHAT:
             self.panel_main.visible = True
@@ -124,9 +162,19 @@ class AssistantApp:
         else:
             raise ValueError(f'Unknown event {event.new}')
 
-        existing_memory = across_thread_memory.search(namespace)
+        existing_memory = get_across_thread_memory().search(namespace)
         component.value = [entry.value for entry in existing_memory]
 
+    def refresh_memory_editor(self, namespace: tuple[str, ...]) -> None:
+        """Reloads the JSON editor showing the memory type of the given namespace."""
+        editors = {
+            MemoryType.USER_PROFILE.value: self.je_user_profile,
+            MemoryType.TODO.value: self.je_todos,
+            MemoryType.INSTRUCTIONS.value: self.je_instructions,
+        }
+        if component := editors.get(namespace[0]):
+            component.value = [entry.value for entry in get_across_thread_memory().search(namespace)]
+
     def submit_message_action(self, event: Event | MockEvent) -> None:
         """Handles message submission and updates the chat feed."""
         self.btn_simulate_conv.disabled = True  # any interaction with the Input Field disables the Simulation Button
@@ -134,18 +182,59 @@ class AssistantApp:
 
         user_message = event.new
         if user_message:
-            msg_settings = dict(
-                show_avatar=True, show_user=False, show_timestamp=True, show_copy_icon=False, show_edit_icon=False, reaction_icons={}
-            )
-
-            self.chat_feed.append(pn.chat.ChatMessage(user_message, avatar=chr(0xC6C3), user='user', **msg_settings))
+            if not self.history_at_latest:
+                self.load_latest_messages()
+            self.append_message(user_message, user='user')
             response = self.get_llm_response(user_message)
-            self.chat_feed.append(pn.chat.ChatMessage(response, avatar=chr(0x2728), user='ai', **msg_settings))
+            self.append_message(response, user='ai')
+
+    def append_message(self, text: str, user: str) -> None:
+        """Appends a message to the chat feed, retiring the oldest ones beyond MAX_LIVE_MESSAGES."""
+        self.chat_feed.append(pn.chat.ChatMessage(text, avatar=AVATARS[user], user=user, **MSG_SETTINGS))
+        retired, live = self.chat_feed.objects[:-MAX_LIVE_MESSAGES], self.chat_feed.objects[-MAX_LIVE_MESSAGES:]
+        if retired:
+            # reminders are not part of the conversation thread, hence not counted in the transcript
+            self.history_start += sum(1 for message in retired if message.user != 'reminder')
+            self.chat_feed.objects = live
+        self.btn_load_earlier.visible = self.history_start > 0
+
+    def get_transcript(self) -> list[tuple[str, str]]:
+        """Reconstructs the chat from the thread's checkpoint, as (user, text) pairs in the order shown in the feed."""
+        transcript = []
+        for message in get_graph().get_state(self.conversation_thread).values.get('messages', []):
+            if message.type == 'human':
+                transcript.append(('user', message.content))
+                transcript.append(('ai', ''))
+            elif message.type == 'ai' and transcript:
+                # all AI messages of a turn are shown together, see get_llm_response
+                transcript[-1] = ('ai', transcript[-1][1] + message.content)
+        return transcript
+
+    def show_history(self, start: int) -> None:
+        """Replaces the chat feed with up to MAX_LIVE_MESSAGES messages of the transcript, starting at `start`."""
+        transcript = self.get_transcript()
+        start = max(min(start, len(transcript) - MAX_LIVE_MESSAGES), 0)
+        end = min(start + MAX_LIVE_MESSAGES, len(transcript))
+        self.chat_feed.objects = [
+            pn.chat.ChatMessage(text, avatar=AVATARS[user], user=user, **MSG_SETTINGS)
+            for user, text in transcript[start:end]
+        ]
+        self.history_start = start
+        self.history_at_latest = end == len(transcript)
+        self.btn_load_earlier.visible = start > 0
+        self.btn_load_latest.visible = not self.history_at_latest
+
+    def load_earlier_messages(self, event: Event | MockEvent = None) -> None:
+        if self.history_start > 0:
+            self.show_history(self.history_start - HISTORY_PAGE_SIZE)
+
+    def load_latest_messages(self, event: Event | MockEvent = None) -> None:
+        self.show_history(len(self.get_transcript()))
 
     def get_llm_response(self, message: str) -> str:
         """Invokes the inference graph; collects the response."""
         response: str = ''
-        for event in graph_todo.stream(
+        for event in get_graph().stream(
             input={'messages': [HumanMessage(content=message)]},
             config=self.conversation_thread,
             stream_mode='values'
@@ -188,3 +277,33 @@ Create or update few ToDos:
     def get_dashboard(self) -> pn.Column:
         """Returns the Panel dashboard."""
         return self.dashboard
+
+
+class MemoryEditorRefresher(MemoryChangeListener):
+    def __init__(self, app: AssistantApp):
+        self.app = app
+
+    def update(self, namespace: tuple[str, ...] = None, events: list[ChangeEvent] = None) -> None:
+        if events:
+            self.app.refresh_memory_editor(namespace)
+
+
+class DeadlineReminder(ReminderListener):
+    def __init__(self, app: AssistantApp):
+        self.app = app
+        # reminders come from the scheduler's thread; the chat is only changed from its session's event loop
+        self.document = pn.state.curdoc if pn.state.curdoc and pn.state.curdoc.session_context else None
+
+    def update(self, namespace: tuple[str, ...] = None, key: str = None, task: str = None, deadline: datetime = None) -> None:
+        if namespace[-1] != self.app.user_id:
+            return
+        text = f'Reminder: "{task}" was due {deadline.isoformat(timespec="minutes")}'
+        if self.document is not None:
+            self.document.add_next_tick_callback(partial(self.show, text))
+        else:
+            self.show(text)
+
+    def show(self, text: str) -> None:
+        if not self.app.history_at_latest:
+            self.app.load_latest_messages()
+        self.app.append_message(text, user='reminder')
@@ -0,0 +1,245 @@
+import random
+import re
+import threading
+import zlib
+from typing import Any, Literal
+from weakref import WeakKeyDictionary
+
+from langgraph.store.base import BaseStore, Item
+
+from assistant.models import ToDo
+from assistant.reminders import CLOSED_STATUSES, get_deadline_scheduler
+
+DedupMode = Literal['off', 'flag', 'merge']
+
+# ToDos whose task words overlap at least this much (Jaccard similarity) are near-duplicates; they are merged only when
+# the words of the new task contain those of the existing one (e.g. `Buy rye bread at Whole Foods` and `Buy rye bread`),
+# as distinct tasks overlap this much too (e.g. `Renew car insurance` and `Renew home insurance`)
+SIMILARITY_THRESHOLD = 0.5
+
+# MinHash signature of NUM_BANDS * ROWS_PER_BAND values; two tasks become candidates when all values of a band match,
+# i.e. with probability 1 - (1 - s^4)^32 for a similarity s: 0.87 at the threshold, under 0.01 below 0.2
+NUM_BANDS = 32
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)
+]
+
+STOPWORDS = {
+    'a', 'an', 'the', 'to', 'for', 'of', 'on', 'in', 'at', 'by', 'with', 'from', 'and', 'or', 'my', 'our', 'your',
+    'some', 'up', 'new', 'get',
+}
+WORD = re.compile(r"[a-z0-9']+")
+
+
+def shingles(task: str) -> frozenset[str]:
+    """Words of the task, stopwords removed unless there is nothing else."""
+    words = WORD.findall(task.lower())
+    return frozenset(word for word in words if word not in STOPWORDS) or frozenset(words)
+
+
+def minhash(words: frozenset[str]) -> tuple[int, ...]:
+    hashes = [zlib.crc32(word.encode()) for word in words]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(words: frozenset[str], other_words: frozenset[str]) -> float:
+    if not words or not other_words:
+        return 0.0
+    return len(words & other_words) / len(words | other_words)
+
+
+def contains(task: str, other_task: str) -> bool:
+    """Whether the words of `task` include all those of `other_task`, i.e. it is the same task, possibly more specific."""
+    return shingles(other_task) <= shingles(task)
+
+
+class MinHashIndex:
+    """ LSH index of ToDo tasks, finding near-duplicates without comparing against every ToDo.
+
+    Candidates sharing a band of their MinHash signature are verified by the exact Jaccard similarity of their words.
+    """
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._buckets: list[dict[tuple[int, ...], set[str]]] = [dict() for _ in range(NUM_BANDS)]
+        self._entries: dict[str, tuple[frozenset[str], tuple[int, ...]]] = dict()  # words and signature per key
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def _bands(signature: tuple[int, ...]) -> list[tuple[int, ...]]:
+        return [signature[i * ROWS_PER_BAND:(i + 1) * ROWS_PER_BAND] for i in range(NUM_BANDS)]
+
+    def add(self, key: str, task: str) -> None:
+        """Indexes (or re-indexes) the task of the ToDo stored under `key`."""
+        words = shingles(task)
+        with self._lock:
+            if key in self._entries and self._entries[key][0] == words:
+                return
+            self._remove(key)
+            if not words:
+                return
+            signature = minhash(words)
+            self._entries[key] = (words, signature)
+            for buckets, band in zip(self._buckets, self._bands(signature)):
+                buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        if (entry := self._entries.pop(key, None)) is None:
+            return
+        for buckets, band in zip(self._buckets, self._bands(entry[1])):
+            buckets[band].discard(key)
+            if not buckets[band]:
+                del buckets[band]
+
+    def query(self, task: str) -> list[tuple[str, float]]:
+        """Returns the keys of the near-duplicates of `task` with their similarity, the most similar first."""
+        words = shingles(task)
+        if not words:
+            return []
+        with self._lock:
+            candidates = set()
+            for buckets, band in zip(self._buckets, self._bands(minhash(words))):
+                candidates |= buckets.get(band, set())
+            matches = [(key, jaccard(words, self._entries[key][0])) for key in candidates]
+        return sorted(((key, s) for key, s in matches if s >= self.threshold), key=lambda match: -match[1])
+
+
+# indexes per store and ToDo namespace, built on first use
+_indexes: WeakKeyDictionary[BaseStore, dict[tuple[str, ...], MinHashIndex]] = WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def iter_items(store: BaseStore, namespace: tuple[str, ...], page_size: int = 100):
+    """Yields all items of the namespace, paging through the store."""
+    offset = 0
+    while page := store.search(namespace, limit=page_size, offset=offset):
+        yield from page
+        offset += len(page)
+
+
+def get_todo_index(store: BaseStore, namespace: tuple[str, ...]) -> MinHashIndex:
+    with _indexes_lock:
+        indexes = _indexes.setdefault(store, dict())
+        if namespace not in indexes:
+            index = MinHashIndex()
+            for item in iter_items(store, namespace):
+                index.add(item.key, item.value['task'])
+            indexes[namespace] = index
+        return indexes[namespace]
+
+
+def merge_todos(existing: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    """Merges a near-duplicate ToDo into an existing one.
+
+    The new task text is taken only when it contains the existing one; other fields are taken from the new ToDo only
+    when set to other than their defaults (a newly extracted ToDo does not reset an `in progress` status);
+    solutions of both are kept.
+    """
+    defaults = {name: field.default for name, field in ToDo.model_fields.items() if not field.is_required()}
+    merged = dict(existing)
+    for name, value in new.items():
+        if value is not None and value not in ('', []) and value != defaults.get(name):
+            merged[name] = value
+    merged['task'] = new['task'] if contains(new['task'], existing['task']) else existing['task']
+    merged['solutions'] = list(dict.fromkeys(existing.get('solutions', []) + new.get('solutions', [])))
+    return merged
+
+
+def find_near_duplicates(store: BaseStore, namespace: tuple[str, ...], todo: dict[str, Any]) -> list[Item]:
+    """Returns the stored open ToDos that `todo` is a near-duplicate of, the most similar first.
+
+    Candidates are checked against the store, so ToDos changed or deleted behind the index's back are never matched.
+    """
+    index = get_todo_index(store, namespace)
+    duplicates = []
+    for key, _ in index.query(todo['task']):
+        item = store.get(namespace, key)
+        if item is None:
+            index.remove(key)
+        elif jaccard(shingles(todo['task']), shingles(item.value['task'])) < index.threshold:
+            index.add(key, item.value['task'])
+        elif item.value.get('status') not in CLOSED_STATUSES:
+            duplicates.append(item)
+    return duplicates
+
+
+def deduplicate_todo(
+    store: BaseStore, namespace: tuple[str, ...], todo: dict[str, Any], mode: DedupMode
+) -> tuple[str | None, dict[str, Any], str | None]:
+    """Checks a new ToDo for a near-duplicate before it is saved.
+
+    In the `merge` mode, a ToDo whose task contains the task of a near-duplicate is merged into it; other
+    near-duplicates are flagged, as in the `flag` mode.
+
+    Returns:
+        the key to save the ToDo under (the near-duplicate's, when merging), None for a new key;
+        the value to save (merged into the near-duplicate, when merging);
+        the key of the near-duplicate, if any.
+    """
+    if mode == 'off' or not (duplicates := find_near_duplicates(store, namespace, todo)):
+        return None, todo, None
+    if mode == 'merge':
+        for item in duplicates:
+            if contains(todo['task'], item.value['task']):
+                return item.key, merge_todos(item.value, todo), item.key
+    return None, todo, duplicates[0].key
+
+
+def index_todo(store: BaseStore, namespace: tuple[str, ...], key: str, todo: dict[str, Any]) -> None:
+    """Keeps the index in step with a ToDo saved to the store."""
+    get_todo_index(store, namespace).add(key, todo['task'])
+
+
+def dedup_namespace(store: BaseStore, namespace: tuple[str, ...]) -> dict[str, str]:
+    """Bulk pass merging the near-duplicate open ToDos of a namespace into the oldest ToDo of each group.
+
+    As at write time, a ToDo is merged only when its task contains the task it is merged into.
+
+    Returns:
+        the key each removed ToDo was merged into
+    """
+    index = MinHashIndex()
+    kept: dict[str, dict[str, Any]] = dict()
+    merged_into: dict[str, str] = dict()
+    for item in sorted(iter_items(store, namespace), key=lambda item: item.created_at):
+        duplicate_of = None
+        if item.value.get('status') not in CLOSED_STATUSES:
+            duplicate_of = next((
+                key for key, _ in index.query(item.value['task'])
+                if key in kept and contains(item.value['task'], kept[key]['task'])
+            ), None)
+        if duplicate_of is None:
+            index.add(item.key, item.value['task'])
+            if item.value.get('status') not in CLOSED_STATUSES:
+                kept[item.key] = item.value
+            continue
+        kept[duplicate_of] = merge_todos(kept[duplicate_of], item.value)
+        index.add(duplicate_of, kept[duplicate_of]['task'])
+        merged_into[item.key] = duplicate_of
+
+    scheduler = get_deadline_scheduler()
+    for key in set(merged_into.values()):
+        store.put(namespace, key, kept[key])
+        scheduler.schedule(namespace, key, kept[key])
+    for key in merged_into:
+        store.delete(namespace, key)
+        scheduler.cancel(namespace, key)
+
+    # the index of the namespace is rebuilt on next use
+    with _indexes_lock:
+        _indexes.get(store, dict()).pop(namespace, None)
+    return merged_into
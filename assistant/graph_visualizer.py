@@ -1,9 +1,7 @@
 import base64
 
-import networkx as nx
 import panel as pn
-from langgraph.graph import StateGraph
-from pyvis.network import Network
+from langgraph.graph.state import CompiledStateGraph
 
 from assistant.inf_graph_todo import RouteListener
 
@@ -14,12 +12,14 @@ SOURCE_NODE_COLOR = 'green'
 
 
 class GraphVisualizer(pn.pane.HTML):
-    def __init__(self, graph: StateGraph, **params):
+    def __init__(self, graph: CompiledStateGraph, **params):
         """Initialize with a LangGraph instance and set up the PyVis network."""
         super().__init__('', sizing_mode='stretch_both', **params)  # Start with empty HTML
 
+        # networkx and pyvis are only needed once a visualizer is displayed; keep them off the import path
+        from pyvis.network import Network
+
         self.graph = graph
-        self.nx_G = nx.DiGraph()
         self.pyvis_network = Network(height='800px', width='100%', directed=True)
         self.node_colors: dict[str, str] = dict()
         self.layout_positions: dict[str, dict[str, float]] = dict()  # Store node positions
@@ -30,6 +30,9 @@ class GraphVisualizer(pn.pane.HTML):
 
     def _build_graph(self) -> None:
         """Constructs the initial NetworkX graph from LangGraph."""
+        import networkx as nx
+
+        self.nx_G = nx.DiGraph()
         edges = self.graph.get_graph(xray=1).edges
         for edge in edges:
             self.nx_G.add_edge(edge[0], edge[1])
@@ -108,8 +111,12 @@ class GraphVisualizer(pn.pane.HTML):
 
 
 class NodeColorizer(RouteListener):
-    def __init__(self, graph_visualizer: GraphVisualizer, **params):
+    """ Colors the routes taken in the conversation thread of its app; routes of other sessions' threads are ignored """
+    def __init__(self, graph_visualizer: GraphVisualizer, thread_id: str, **params):
         self.graph_visualizer = graph_visualizer
+        self.thread_id = thread_id
 
-    def update(self, current_node: str = None, next_node: str = None) -> None:
+    def update(self, current_node: str = None, next_node: str = None, thread_id: str = None) -> None:
+        if thread_id != self.thread_id:
+            return
         self.graph_visualizer.update_node_color(source_node=current_node, target_node=next_node)
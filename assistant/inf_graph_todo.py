@@ -1,19 +1,29 @@
+import logging
 import uuid
 from datetime import datetime
+from functools import cache
 from typing import Literal
 
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage, SystemMessage, merge_message_runs, BaseMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, END, StateGraph, MessagesState
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.store.base import BaseStore
 from langgraph.store.memory import InMemoryStore
-from trustcall import create_extractor
 
 import assistant.models
 from assistant.models import UserProfile, ToDo, UpdateMemory, MemoryType
-from assistant.services import llm_4o, llm_llama3_1_8b
-from assistant.inspector import ToolInvocationInspector, extract_tool_info
+from assistant.inspector import ChangeEvent, ToolInvocationInspector, format_change_events
+from assistant.reminders import get_deadline_scheduler
+from assistant.dedup import deduplicate_todo, index_todo
+from assistant.prompt_serializer import (
+    serialize_profile, serialize_todos, serialize_instructions, report_section_tokens
+)
+
+logger = logging.getLogger(__name__)
 
 # Chatbot instruction for choosing:
 # - what to update: user_profile, list of todos or instructions
@@ -78,14 +88,49 @@ Your current instructions are:
 {current_instructions}
 </current_instructions>"""
 
-the_model = llm_llama3_1_8b
+DEFAULT_MODEL_NAME = 'llm_llama3_1_8b'
+
+_the_model: BaseChatModel | None = None
+
+
+def get_model() -> BaseChatModel:
+    """Returns the chat model driving all nodes; the default client is created on first use."""
+    global _the_model
+    if _the_model is None:
+        from assistant.services import get_llm
+        _the_model = get_llm(DEFAULT_MODEL_NAME)
+    return _the_model
+
+
+def set_model(model: BaseChatModel) -> None:
+    """Replaces the chat model (e.g. with a stub for headless runs) and drops extractors bound to the old one."""
+    global _the_model
+    _the_model = model
+    get_profile_extractor.cache_clear()
+    get_memories_extractor.cache_clear()
+
 
 ## Create the Trustcall extractors for updating the user profile and ToDo list
-profile_extractor = create_extractor(
-    the_model,
-    tools=[UserProfile],
-    tool_choice=UserProfile.__name__,
-)
+@cache
+def get_profile_extractor() -> Runnable:
+    from trustcall import create_extractor
+    return create_extractor(
+        get_model(),
+        tools=[UserProfile],
+        tool_choice=UserProfile.__name__,
+    )
+
+
+@cache
+def get_memories_extractor() -> Runnable:
+    """Extractor for both User Profile and ToDos, used in the `combined` extraction mode."""
+    from trustcall import create_extractor
+    return create_extractor(
+        get_model(),
+        tools=[UserProfile, ToDo],
+        tool_choice='any',
+        enable_inserts=True
+    )
 
 
 ## Node definitions
@@ -101,23 +146,17 @@ def task_controller(state: MessagesState, config: RunnableConfig, store: BaseSto
     # Retrieve profile memory from the store
     namespace = (MemoryType.USER_PROFILE.value, assistant_type, user_id)
     memories = store.search(namespace)
-    if memories:
-        user_profile = memories[0].value
-    else:
-        user_profile = None
+    user_profile = serialize_profile(memories[0].value if memories else None)
 
     # Retrieve ToDos memories from the store
     namespace = (MemoryType.TODO.value, assistant_type, user_id)
     memories = store.search(namespace)
-    todo = '\n'.join(f'{mem.value}' for mem in memories)
+    todo = serialize_todos([mem.value for mem in memories], now=datetime.now())
 
     # Retrieve custom instructions
     namespace = (MemoryType.INSTRUCTIONS.value, assistant_type, user_id)
     memories = store.search(namespace)
-    if memories:
-        instructions = memories[0].value
-    else:
-        instructions = ''
+    instructions = serialize_instructions(memories[0].value if memories else None)
 
     system_msg = INSTRUCTION_MEMORY_TOOL_AND_RESPONSE.format(
         assistant_role=assistant_role,
@@ -125,9 +164,17 @@ def task_controller(state: MessagesState, config: RunnableConfig, store: BaseSto
         todo=todo,
         instructions=instructions
     )
+    report_section_tokens({
+        'template': INSTRUCTION_MEMORY_TOOL_AND_RESPONSE,
+        'assistant_role': assistant_role,
+        'user_profile': user_profile,
+        'todo': todo,
+        'instructions': instructions,
+        'messages': '\n'.join(str(m.content) for m in state['messages']),
+    })
 
     # Respond using memory as well as the chat history
-    response = the_model.bind_tools(
+    response = get_model().bind_tools(
         tools=[UpdateMemory]  # , parallel_tool_calls=False
     ).invoke(
         [SystemMessage(content=system_msg)] + state['messages']
@@ -163,8 +210,9 @@ def tool_update_user_profile(state: MessagesState, config: RunnableConfig, store
         messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state['messages'][:-1]
     )
 
-    # Invoke the extractor
-    result = profile_extractor.invoke(input={
+    # Invoke the extractor, counting the repair rounds Trustcall needs
+    spy = ToolInvocationInspector(schema_names=(tool_name,))
+    result = get_profile_extractor().with_config(callbacks=[spy]).invoke(input={
         'messages': updated_messages,
         'existing': existing_memories
     })
@@ -176,6 +224,7 @@ def tool_update_user_profile(state: MessagesState, config: RunnableConfig, store
             key=rmeta.get('json_doc_id', str(uuid.uuid4())),
             value=r.model_dump(mode='json'),
         )
+    logger.info('%s: %d Trustcall repair rounds', tool_update_user_profile.__name__, spy.repair_rounds)
 
     tool_calls = state['messages'][-1].tool_calls
 
@@ -191,6 +240,17 @@ def tool_update_user_profile(state: MessagesState, config: RunnableConfig, store
     }
 
 
+def note_duplicate(event: ChangeEvent | None, duplicate_of: str | None) -> None:
+    """Reports a new ToDo found to be a near-duplicate: merged into the existing one, or flagged next to it."""
+    if event is None or duplicate_of is None:
+        return
+    if event.doc_id == duplicate_of:
+        event.type = 'update'
+        event.planned_edits = 'Merged a near-duplicate new ToDo into this one'
+    else:
+        event.duplicate_of = duplicate_of
+
+
 def tool_update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
 
@@ -220,15 +280,16 @@ def tool_update_todos(state: MessagesState, config: RunnableConfig, store: BaseS
     )
 
     # Initialize the spy for visibility into the tool calls made by Trustcall
-    spy = ToolInvocationInspector()
+    spy = ToolInvocationInspector(schema_names=(tool_name,))
 
     # Create the Trustcall extractor for updating the ToDo list
+    from trustcall import create_extractor
     todo_extractor = create_extractor(
-        the_model,
+        get_model(),
         tools=[ToDo],
         tool_choice=tool_name,
         enable_inserts=True
-    ).with_listeners(on_end=spy)
+    ).with_config(callbacks=[spy])
 
     # Invoke the extractor
     result = todo_extractor.invoke({
@@ -238,17 +299,26 @@ def tool_update_todos(state: MessagesState, config: RunnableConfig, store: BaseS
 
     # Save the memories from Trustcall to the store
     for r, rmeta in zip(result['responses'], result['response_metadata']):
-        store.put(
-            namespace,
-            rmeta.get('json_doc_id', str(uuid.uuid4())),
-            r.model_dump(mode='json'),
-        )
+        key = rmeta.get('json_doc_id')
+        value = r.model_dump(mode='json')
+        duplicate_of = None
+        if key is None:
+            key, value, duplicate_of = deduplicate_todo(store, namespace, value, configurable.todo_dedup)
+        key = key or str(uuid.uuid4())
+        store.put(namespace, key, value)
+        index_todo(store, namespace, key, value)
+        note_duplicate(spy.resolve(call_id=rmeta['id'], doc_id=key, value=value), duplicate_of)
+        get_deadline_scheduler().schedule(namespace, key, value)
+    logger.info('%s: %d Trustcall repair rounds', tool_update_todos.__name__, spy.repair_rounds)
+
+    for listener in memory_change_listeners:
+        listener.update(namespace=namespace, events=spy.events)
 
     # Respond to the tool call made in task_controller, confirming the update
     tool_calls = state['messages'][-1].tool_calls
 
-    # Extract the changes made by Trustcall and add the ToolMessage returned to task_controller
-    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
+    # Report the changes made by Trustcall in the ToolMessage returned to task_controller
+    todo_update_msg = format_change_events(spy.events, tool_name)
     return {
         'messages': [
             {
@@ -260,6 +330,102 @@ def tool_update_todos(state: MessagesState, config: RunnableConfig, store: BaseS
     }
 
 
+def fold_profile(existing: dict, new: dict) -> dict:
+    """Folds a newly extracted User Profile into the existing one: new values win, list fields are united."""
+    folded = {**existing, **{field: v for field, v in new.items() if v and not isinstance(v, list)}}
+    for field, v in new.items():
+        if isinstance(v, list):
+            folded[field] = list(dict.fromkeys((existing.get(field) or []) + v))
+    return folded
+
+
+def tool_update_memories(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Reflect on the chat history and update both User Profile and ToDo memory collections in a single extraction."""
+
+    # Get the user ID from the config
+    configurable = assistant.models.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    assistant_type = configurable.assistant_type
+
+    # Define the namespaces for the memories, per Trustcall tool
+    namespaces = {
+        UserProfile.__name__: (MemoryType.USER_PROFILE.value, assistant_type, user_id),
+        ToDo.__name__: (MemoryType.TODO.value, assistant_type, user_id),
+    }
+
+    # Retrieve the most recent memories from both namespaces and format them for the Trustcall extractor
+    existing_items = {
+        tool_name: store.search(namespace) for tool_name, namespace in namespaces.items()
+    }
+    existing_memories = [
+        (existing_item.key, tool_name, existing_item.value)
+        for tool_name, items in existing_items.items()
+        for existing_item in items
+    ]
+    doc_schemas = {key: tool_name for key, tool_name, _ in existing_memories}
+
+    # Merge the chat history and the instruction
+    INSTRUCTIONS_USER_MEMORY_UPDATE_FMT = INSTRUCTION_USER_MEMORY_UPDATE.format(time=datetime.now().isoformat())
+    updated_messages = merge_message_runs(
+        messages=[SystemMessage(content=INSTRUCTIONS_USER_MEMORY_UPDATE_FMT)] + state['messages'][:-1]
+    )
+
+    # Invoke the extractor
+    spy = ToolInvocationInspector(schema_names=tuple(namespaces))
+    result = get_memories_extractor().with_config(callbacks=[spy]).invoke({
+        'messages': updated_messages,
+        'existing': existing_memories or None
+    })
+
+    # Demultiplex the responses into the namespace of their schema
+    for r, rmeta in zip(result['responses'], result['response_metadata']):
+        tool_name = type(r).__name__
+        value = r.model_dump(mode='json')
+        key = rmeta.get('json_doc_id')
+        if key is None and tool_name == UserProfile.__name__ and existing_items[tool_name]:
+            # there is a single User Profile: fold a newly extracted one into it
+            profile = existing_items[tool_name][0]
+            key = profile.key
+            value = fold_profile(profile.value, value)
+        duplicate_of = None
+        if key is None and tool_name == ToDo.__name__:
+            key, value, duplicate_of = deduplicate_todo(store, namespaces[tool_name], value, configurable.todo_dedup)
+        key = key or str(uuid.uuid4())
+        store.put(namespaces[tool_name], key, value)
+        event = spy.resolve(call_id=rmeta['id'], doc_id=key, value=value, schema_name=tool_name)
+        if tool_name == ToDo.__name__:
+            index_todo(store, namespaces[tool_name], key, value)
+            note_duplicate(event, duplicate_of)
+            get_deadline_scheduler().schedule(namespaces[tool_name], key, value)
+        doc_schemas[key] = tool_name
+    logger.info('%s: %d Trustcall repair rounds', tool_update_memories.__name__, spy.repair_rounds)
+
+    events = {tool_name: [] for tool_name in namespaces}
+    for event in spy.events:
+        if tool_name := event.schema_name or doc_schemas.get(event.doc_id):
+            events[tool_name].append(event)
+    for tool_name, namespace in namespaces.items():
+        for listener in memory_change_listeners:
+            listener.update(namespace=namespace, events=events[tool_name])
+
+    # Respond to every User Profile and ToDo tool call made in task_controller
+    update_types = {
+        MemoryType.USER_PROFILE.value: UserProfile.__name__,
+        MemoryType.TODO.value: ToDo.__name__,
+    }
+    tool_calls = state['messages'][-1].tool_calls
+    return {
+        'messages': [
+            {
+                'role': 'tool',
+                'content': format_change_events(events[update_types[tool_call['args']['update_type']]]) or 'no changes',
+                'tool_call_id': tool_call['id']
+            }
+            for tool_call in tool_calls if tool_call['args'].get('update_type') in update_types
+        ]
+    }
+
+
 def tool_update_instructions(state: MessagesState, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
     key = 'user_instructions'
@@ -276,7 +442,7 @@ def tool_update_instructions(state: MessagesState, config: RunnableConfig, store
     system_msg = INSTRUCTION_INSTRUCTIONS_MEMORY_UPDATE.format(
         current_instructions=existing_memory.value if existing_memory else None
     )
-    new_memory = the_model.invoke(
+    new_memory = get_model().invoke(
         [SystemMessage(content=system_msg)]
         + state['messages'][:-1]
         + [HumanMessage(content='Please update the instructions based on the conversation')]
@@ -300,24 +466,39 @@ def tool_update_instructions(state: MessagesState, config: RunnableConfig, store
 
 
 class RouteListener:
-    def update(self, current_node: str = None, next_node: str = None) -> None:
+    def update(self, current_node: str = None, next_node: str = None, thread_id: str = None) -> None:
         raise NotImplementedError()
 
 
 route_listeners: set[RouteListener] = set()
 
 
+class MemoryChangeListener:
+    def update(self, namespace: tuple[str, ...] = None, events: list[ChangeEvent] = None) -> None:
+        raise NotImplementedError()
+
+
+memory_change_listeners: set[MemoryChangeListener] = set()
+
+
 # Conditional edge
 def route_message(
     state: MessagesState, config: RunnableConfig, store: BaseStore
-) -> Literal[END, tool_update_todos.__name__, tool_update_instructions.__name__, tool_update_user_profile.__name__]:
+) -> Literal[
+    END, tool_update_todos.__name__, tool_update_instructions.__name__, tool_update_user_profile.__name__,
+    tool_update_memories.__name__
+]:
     """Reflect on the memories and chat history to decide whether to update the memory collection."""
     message = state['messages'][-1]
+    configurable = assistant.models.Configuration.from_runnable_config(config)
     if len(message.tool_calls) == 0:
         selected_node = END
     else:
         tool_call = message.tool_calls[0]
-        if tool_call['args']['update_type'] == MemoryType.USER_PROFILE.value:
+        if (configurable.extraction_mode == 'combined'
+                and tool_call['args']['update_type'] in (MemoryType.USER_PROFILE.value, MemoryType.TODO.value)):
+            selected_node = tool_update_memories.__name__
+        elif tool_call['args']['update_type'] == MemoryType.USER_PROFILE.value:
             selected_node = tool_update_user_profile.__name__
         elif tool_call['args']['update_type'] == MemoryType.TODO.value:
             selected_node = tool_update_todos.__name__
@@ -328,7 +509,10 @@ def route_message(
 
     global route_listeners
     for route_listener in route_listeners:
-        route_listener.update(current_node=config['metadata']['langgraph_node'], next_node=selected_node)
+        route_listener.update(
+            current_node=config['metadata']['langgraph_node'], next_node=selected_node,
+            thread_id=config['configurable'].get('thread_id'),
+        )
     return selected_node
 
 
@@ -341,6 +525,7 @@ def build_graph() -> StateGraph:
     builder.add_node(tool_update_todos)
     builder.add_node(tool_update_user_profile)
     builder.add_node(tool_update_instructions)
+    builder.add_node(tool_update_memories)
 
     # Define the flow
     builder.add_edge(START, task_controller.__name__)
@@ -348,9 +533,23 @@ def build_graph() -> StateGraph:
     builder.add_edge(tool_update_todos.__name__, task_controller.__name__)
     builder.add_edge(tool_update_user_profile.__name__, task_controller.__name__)
     builder.add_edge(tool_update_instructions.__name__, task_controller.__name__)
+    builder.add_edge(tool_update_memories.__name__, task_controller.__name__)
     return builder
 
 
-across_thread_memory = InMemoryStore()  # Store for long-term (across-thread) memory
-within_thread_memory = MemorySaver()  # Checkpointer for short-term (within-thread) memory
-graph = build_graph().compile(checkpointer=within_thread_memory, store=across_thread_memory)
+@cache
+def get_across_thread_memory() -> BaseStore:
+    """Store for long-term (across-thread) memory"""
+    return InMemoryStore()
+
+
+@cache
+def get_within_thread_memory() -> BaseCheckpointSaver:
+    """Checkpointer for short-term (within-thread) memory"""
+    return MemorySaver()
+
+
+@cache
+def get_graph() -> CompiledStateGraph:
+    """Compiles the inference graph on first use, rather than at import time."""
+    return build_graph().compile(checkpointer=get_within_thread_memory(), store=get_across_thread_memory())
@@ -1,77 +1,116 @@
-from typing import Any
+from dataclasses import dataclass
+from typing import Any, Literal
 
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 
-class ToolInvocationInspector:
-    """ Inspect the tool calls for Trustcall """
-    def __init__(self):
-        self.called_tools = []
+# Trustcall tools used to heal invalid tool calls: these are repair rounds, not memory changes
+REPAIR_TOOL_NAMES = {'PatchFunctionErrors', 'PatchFunctionName'}
 
-    def __call__(self, run):
-        q = [run]
-        while q:
-            r = q.pop()
-            if r.child_runs:
-                q.extend(r.child_runs)
-            if r.run_type == 'chat_model':
-                self.called_tools.append(
-                    r.outputs['generations'][0][0]['message']['kwargs']['tool_calls']
-                )
 
+@dataclass(kw_only=True)
+class ChangeEvent:
+    """ A memory change made by Trustcall """
+    type: Literal['new', 'update', 'no_update']
+    doc_id: str | None = None
+    schema_name: str | None = None
+    planned_edits: str | None = None
+    value: Any = None
+    duplicate_of: str | None = None  # near-duplicate document of a new one
 
-def extract_tool_info(tool_calls: list[dict[str, Any]], schema_name='Memory'):
-    """Extract information from tool calls for:
+
+class ToolInvocationInspector(BaseCallbackHandler):
+    """ Captures the tool calls for Trustcall as each chat model run finishes.
+
+    Passed as a callback (rather than a run listener), so the Trustcall run tree is never retained.
+    Events are keyed by document id (or by the id of the tool call creating a new document),
+    hence repair rounds revisiting the same documents do not grow the capture.
+    """
+    def __init__(self, schema_names: tuple[str, ...] = ('Memory',)):
+        self.schema_names = schema_names
+        self.repair_rounds = 0
+        self._events: dict[str, ChangeEvent] = dict()
+
+    @property
+    def events(self) -> list[ChangeEvent]:
+        return list(self._events.values())
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        if not response.generations or not response.generations[0]:
+            return
+        message = getattr(response.generations[0][0], 'message', None)
+        tool_calls = getattr(message, 'tool_calls', None) or []
+
+        is_repair_round = False
+        for call in tool_calls:
+            if call['name'] == 'PatchDoc':
+                doc_id = call['args']['json_doc_id']
+                if call['args']['patches']:
+                    self._events[doc_id] = ChangeEvent(
+                        type='update',
+                        doc_id=doc_id,
+                        planned_edits=call['args']['planned_edits'],
+                        value=call['args']['patches'][0]['value']
+                    )
+                elif doc_id not in self._events:
+                    # Handle case where no changes were needed
+                    self._events[doc_id] = ChangeEvent(
+                        type='no_update',
+                        doc_id=doc_id,
+                        planned_edits=call['args']['planned_edits']
+                    )
+            elif call['name'] in self.schema_names:
+                self._events[call['id']] = ChangeEvent(type='new', schema_name=call['name'], value=call['args'])
+            elif call['name'] in REPAIR_TOOL_NAMES:
+                is_repair_round = True
+
+        if is_repair_round:
+            self.repair_rounds += 1
+
+    def resolve(self, call_id: str, doc_id: str, value: dict[str, Any], schema_name: str = None) -> ChangeEvent | None:
+        """Binds the validated document, as saved to the store, to the event that produced it.
+
+        Args:
+            call_id: id of the tool call, as found in Trustcall `response_metadata`
+            doc_id: key under which the document was saved
+            value: the saved document
+            schema_name: name of the schema the document was validated against
+        """
+        event = self._events.get(call_id) or self._events.get(doc_id)
+        if event is not None:
+            event.doc_id = doc_id
+            event.value = value
+            event.schema_name = schema_name or event.schema_name
+        return event
+
+
+def format_change_events(events: list[ChangeEvent], schema_name='Memory') -> str:
+    """Format change events for:
      - patches
      - new memories in Trustcall.
-    
+
     Args:
-        tool_calls: List of tool calls from the model
+        events: List of change events captured by the ToolInvocationInspector
         schema_name: Name of the schema tool (e.g., "Memory", "ToDo", "UserProfile")
     """
-    # Initialize list of changes
-    changes = []
-    
-    for call_group in tool_calls:
-        for call in call_group:
-            if call['name'] == 'PatchDoc':
-                # Check if there are any patches
-                if call['args']['patches']:
-                    changes.append({
-                        'type': 'update',
-                        'doc_id': call['args']['json_doc_id'],
-                        'planned_edits': call['args']['planned_edits'],
-                        'value': call['args']['patches'][0]['value']
-                    })
-                else:
-                    # Handle case where no changes were needed
-                    changes.append({
-                        'type': 'no_update',
-                        'doc_id': call['args']['json_doc_id'],
-                        'planned_edits': call['args']['planned_edits']
-                    })
-            elif call['name'] == schema_name:
-                changes.append({
-                    'type': 'new',
-                    'value': call['args']
-                })
-
-    # Format results as a single string
     result_parts = []
-    for change in changes:
-        if change['type'] == 'update':
+    for event in events:
+        if event.type == 'update':
             result_parts.append(
-                f'Document {change['doc_id']} updated:\n'
-                f'Plan: {change['planned_edits']}\n'
-                f'Added content: {change['value']}'
+                f'Document {event.doc_id} updated:\n'
+                f'Plan: {event.planned_edits}\n'
+                f'Added content: {event.value}'
             )
-        elif change['type'] == 'no_update':
+        elif event.type == 'no_update':
             result_parts.append(
-                f'Document {change['doc_id']} unchanged:\n'
-                f'{change['planned_edits']}'
+                f'Document {event.doc_id} unchanged:\n'
+                f'{event.planned_edits}'
             )
         else:
             result_parts.append(
-                f'New {schema_name} created:\n'
-                f'Content: {change['value']}'
+                f'New {event.schema_name or schema_name} created:\n'
+                f'Content: {event.value}'
+                + (f'\nPossible duplicate of document {event.duplicate_of}' if event.duplicate_of else '')
             )
-    
+
     return '\n\n'.join(result_parts)
@@ -60,6 +60,10 @@ class Configuration:
     user_id: str = 'default-user'
     assistant_type: str = 'general'
     assistant_role: str = "You are a helpful task management assistant. You help to create, organize, and track the user's ToDo list."
+    # 'combined' updates User Profile and ToDos in a single Trustcall invocation, rather than one per memory type
+    extraction_mode: Literal['separate', 'combined'] = 'separate'
+    # near-duplicates of existing ToDos, among newly extracted ones, are flagged, merged into them, or let through
+    todo_dedup: Literal['off', 'flag', 'merge'] = 'flag'
 
     @classmethod
     def from_runnable_config(cls, config: Optional[RunnableConfig] = None) -> Self:
@@ -0,0 +1,142 @@
+import logging
+import re
+from datetime import datetime
+from typing import Any
+
+from assistant.models import UserProfile, ToDo
+
+logger = logging.getLogger(__name__)
+
+# ToDo fields in table column order, with their (shorter) column titles
+TODO_COLUMNS = {
+    'task': 'task',
+    'time_to_complete': 'minutes',
+    'deadline': 'deadline',
+    'solutions': 'solutions',
+    'status': 'status',
+}
+
+# word pieces and single punctuation marks, the units BPE tokenizers split text into most often
+TOKEN_PIECE = re.compile(r'\w+|[^\w\s]')
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimates the number of LLM tokens in the text.
+
+    No tokenizer for the local llama models is available in-process, hence the approximation:
+    a token per word or punctuation mark, plus one per each further 6 characters of long words.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in TOKEN_PIECE.findall(text))
+
+
+def _defaults(model: type[UserProfile | ToDo]) -> dict[str, Any]:
+    defaults = dict()
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            defaults[name] = field.default_factory()
+        elif not field.is_required():
+            defaults[name] = field.default
+    return defaults
+
+
+def _is_omitted(value: Any, default: Any) -> bool:
+    return value is None or value == default or value in ('', [])
+
+
+def format_relative_date(value: str | datetime, now: datetime) -> str:
+    """Shortens a date relative to now, e.g. `overdue 2h`, `today 17:30`, `tomorrow 09:00`, `Fri 12:00` or `Nov 18`."""
+    when = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+
+    delta = when - now
+    if delta.total_seconds() < 0:
+        overdue = -delta
+        if overdue.days:
+            return f'overdue {overdue.days}d'
+        if overdue.seconds >= 3600:
+            return f'overdue {overdue.seconds // 3600}h'
+        return f'overdue {overdue.seconds // 60}m'
+
+    days_ahead = (when.date() - now.date()).days
+    if days_ahead == 0:
+        return f'today {when:%H:%M}'
+    if days_ahead == 1:
+        return f'tomorrow {when:%H:%M}'
+    if days_ahead < 7:
+        return f'{when:%a %H:%M}'
+    if when.year == now.year:
+        return f'{when:%b %d}'
+    return f'{when:%Y-%m-%d}'
+
+
+def serialize_profile(profile: dict[str, Any] | None) -> str:
+    """Renders the User Profile as `field: value` lines, without empty and default fields."""
+    if not profile:
+        return ''
+    defaults = _defaults(UserProfile)
+    lines = []
+    for name, value in profile.items():
+        if _is_omitted(value, defaults.get(name)):
+            continue
+        if isinstance(value, list):
+            value = ', '.join(str(v) for v in value)
+        lines.append(f'{name}: {value}')
+    return '\n'.join(lines)
+
+
+def serialize_todos(todos: list[dict[str, Any]], now: datetime) -> str:
+    """
+    Renders ToDos as a pipe-separated table.
+
+    Columns that are empty or default in every row are dropped; in the columns kept, only empty cells are blank,
+    default values (e.g. status `not started`) are spelled out. Deadlines are shortened relative to `now`.
+    """
+    if not todos:
+        return ''
+    defaults = _defaults(ToDo)
+
+    rows = []
+    for todo in todos:
+        row = dict()
+        for name in TODO_COLUMNS:
+            value = todo.get(name)
+            if value is None or value in ('', []):
+                cell = ''
+            elif name == 'deadline':
+                cell = format_relative_date(value, now)
+            elif isinstance(value, list):
+                cell = '; '.join(str(v) for v in value)
+            else:
+                cell = str(value)
+            row[name] = cell.replace('|', '/').replace('\n', ' ')
+        rows.append(row)
+
+    columns = [
+        name for name in TODO_COLUMNS
+        if any(not _is_omitted(todo.get(name), defaults.get(name)) for todo in todos)
+    ]
+    lines = [' | '.join(TODO_COLUMNS[name] for name in columns)]
+    lines.extend(' | '.join(row[name] for name in columns) for row in rows)
+    return '\n'.join(lines)
+
+
+def serialize_instructions(instructions: dict[str, Any] | None) -> str:
+    """Renders the stored instructions text with collapsed whitespace and blank lines."""
+    if not instructions:
+        return ''
+    text = instructions.get('memory', '') if isinstance(instructions, dict) else str(instructions)
+    lines = (re.sub(r'[ \t]+', ' ', line).strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def report_section_tokens(sections: dict[str, str]) -> dict[str, int]:
+    """Counts (estimated) tokens of each prompt section and logs the breakdown."""
+    section_tokens = {name: count_tokens(text) for name, text in sections.items()}
+    logger.info(
+        'prompt tokens: %d (%s)',
+        sum(section_tokens.values()),
+        ', '.join(f'{name}={tokens}' for name, tokens in section_tokens.items())
+    )
+    return section_tokens
@@ -0,0 +1,129 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+from functools import cache
+from typing import Any
+
+# ToDo statuses which need no reminders
+CLOSED_STATUSES = {'done', 'archived'}
+
+# heap is rebuilt once stale entries (rescheduled or cancelled ToDos) outnumber the live ones by this factor
+HEAP_COMPACTION_FACTOR = 2
+
+
+class ReminderListener:
+    """ Notified on the scheduler's thread: listeners touching UI state must hand the update over to its own thread """
+    def update(self, namespace: tuple[str, ...] = None, key: str = None, task: str = None, deadline: datetime = None) -> None:
+        raise NotImplementedError()
+
+
+reminder_listeners: set[ReminderListener] = set()
+
+
+class DeadlineScheduler:
+    """ Fires reminders when ToDo deadlines come due.
+
+    Deadlines are kept in a min-heap of (deadline, namespace, key), updated incrementally as ToDos are written,
+    and a single daemon thread sleeps until the earliest one; there is no polling of the store.
+    A rescheduled or closed ToDo leaves its old heap entry behind, which is skipped as stale when it surfaces.
+    A deadline fires once: writing the ToDo again (e.g. patching an overdue task) does not repeat its reminder.
+    """
+    def __init__(self):
+        self._heap: list[tuple[float, tuple[str, ...], str]] = []
+        self._scheduled: dict[tuple[tuple[str, ...], str], tuple[float, str]] = dict()  # live (deadline, task) per ToDo
+        # last deadline fired per ToDo, until the ToDo is rescheduled or cancelled: at most one per overdue open ToDo
+        self._fired: dict[tuple[tuple[str, ...], str], float] = dict()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def schedule(self, namespace: tuple[str, ...], key: str, todo: dict[str, Any]) -> None:
+        """(Re)schedules the reminder for the ToDo stored under `namespace`/`key`; cancels it if there is nothing to remind of."""
+        if todo.get('deadline') is None or todo.get('status') in CLOSED_STATUSES:
+            self.cancel(namespace, key)
+            return
+
+        deadline = todo['deadline']
+        deadline = datetime.fromisoformat(deadline) if isinstance(deadline, str) else deadline
+        entry = (deadline.timestamp(), todo['task'])
+        with self._condition:
+            if (fired := self._fired.get((namespace, key))) == entry[0]:
+                self._scheduled.pop((namespace, key), None)
+                return
+            if fired is not None:
+                del self._fired[(namespace, key)]
+            if self._scheduled.get((namespace, key)) == entry:
+                return
+            self._scheduled[(namespace, key)] = entry
+            heapq.heappush(self._heap, (entry[0], namespace, key))
+            self._compact()
+            self._condition.notify()
+
+    def cancel(self, namespace: tuple[str, ...], key: str) -> None:
+        with self._condition:
+            self._scheduled.pop((namespace, key), None)
+            self._fired.pop((namespace, key), None)
+
+    def start(self) -> None:
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='DeadlineScheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _compact(self) -> None:
+        if len(self._heap) > HEAP_COMPACTION_FACTOR * len(self._scheduled) + 1024:
+            self._heap = [(deadline, namespace, key) for (namespace, key), (deadline, _) in self._scheduled.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_due(self, now: float) -> list[tuple[tuple[str, ...], str, str, float]]:
+        """Pops reminders due by `now`, discarding stale entries on the way; must be called holding the lock."""
+        due = []
+        while self._heap:
+            deadline, namespace, key = self._heap[0]
+            entry = self._scheduled.get((namespace, key))
+            if entry is not None and entry[0] == deadline and deadline > now:
+                break
+            heapq.heappop(self._heap)
+            if entry is not None and entry[0] == deadline:
+                del self._scheduled[(namespace, key)]
+                self._fired[(namespace, key)] = deadline
+                due.append((namespace, key, entry[1], deadline))
+        return due
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                due = self._pop_due(time.time())
+                while not due and not self._stopped:
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout=timeout)
+                    due = self._pop_due(time.time())
+                if self._stopped:
+                    return
+
+            # notify outside the lock, so listeners may schedule further reminders
+            for namespace, key, task, deadline in due:
+                for listener in list(reminder_listeners):
+                    listener.update(namespace=namespace, key=key, task=task, deadline=datetime.fromtimestamp(deadline))
+
+
+@cache
+def get_deadline_scheduler() -> DeadlineScheduler:
+    """Returns the process-wide scheduler, started on first use."""
+    scheduler = DeadlineScheduler()
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,246 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Literal, Sequence
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import Field, PrivateAttr
+
+BackendName = Literal['primary', 'secondary']
+
+
+class LatencyMetrics:
+    """ Rolling latencies and outcome counters per backend """
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies: dict[str, deque[float]] = dict()
+        self._counters: dict[str, dict[str, int]] = dict()
+        self.window = window
+
+    def record(self, backend: str, outcome: str, latency: float = None) -> None:
+        """Counts an outcome (success, failure, timeout, hedge, hedge_won, ...); successes also record their latency."""
+        with self._lock:
+            counters = self._counters.setdefault(backend, dict())
+            counters[outcome] = counters.get(outcome, 0) + 1
+            if latency is not None:
+                self._latencies.setdefault(backend, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, backend: str, q: float) -> float | None:
+        with self._lock:
+            latencies = sorted(self._latencies.get(backend, ()))
+        if not latencies:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def sample_count(self, backend: str) -> int:
+        with self._lock:
+            return len(self._latencies.get(backend, ()))
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            backends = set(self._counters) | set(self._latencies)
+            counters = {backend: dict(self._counters.get(backend, {})) for backend in backends}
+        return {
+            backend: {
+                **counters[backend],
+                'p50': self.percentile(backend, 0.5),
+                'p95': self.percentile(backend, 0.95),
+                'p99': self.percentile(backend, 0.99),
+            }
+            for backend in backends
+        }
+
+
+class CircuitBreaker:
+    """ Stops routing to a backend after consecutive failures; after `reset_timeout` lets a single probe through """
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state: Literal['closed', 'open', 'half_open'] = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'  # this request is the probe
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+
+    def release_probe(self) -> None:
+        """Returns a probe that was never sent: the next request is let through as the probe instead."""
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class ResilientChatModel(BaseChatModel):
+    """ Chat model bounding tail latency over a primary and a secondary backend.
+
+    - each call has a deadline, looked up by the LangGraph node making it (the outer graph node, when the call is made
+      from a subgraph such as Trustcall's extractor)
+    - when the primary has not answered within its `hedge_percentile` latency, a duplicate request goes to the secondary
+      and the first answer wins; a failed primary is failed over to the secondary right away
+    - a backend failing repeatedly is routed around by its circuit breaker until a probe succeeds
+    Abandoned requests cannot be interrupted; their answers are discarded and count towards the latency metrics only,
+    leaving circuit breakers alone. Each backend has its own worker pool, so a stalled backend cannot starve the other.
+    """
+    primary: BaseChatModel
+    secondary: BaseChatModel
+    node_deadlines: dict[str, float] = Field(default_factory=dict)
+    default_deadline: float = 120.0
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+    default_hedge_delay: float = 15.0  # used until there are enough latency samples of the primary
+    metrics: LatencyMetrics = Field(default_factory=LatencyMetrics)
+
+    _breakers: dict[str, CircuitBreaker] = PrivateAttr(
+        default_factory=lambda: {'primary': CircuitBreaker(), 'secondary': CircuitBreaker()}
+    )
+    _executors: dict[str, ThreadPoolExecutor] = PrivateAttr(default_factory=lambda: {
+        name: ThreadPoolExecutor(max_workers=8, thread_name_prefix=f'ResilientChatModel-{name}')
+        for name in ('primary', 'secondary')
+    })
+
+    @property
+    def _llm_type(self) -> str:
+        return 'resilient'
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        # tools are bound to each backend on the call, in the backend's own format
+        return self.bind(tools=tools, tool_kwargs=kwargs)
+
+    def _hedge_delay(self) -> float:
+        if self.metrics.sample_count('primary') < self.hedge_min_samples:
+            return self.default_hedge_delay
+        return self.metrics.percentile('primary', self.hedge_percentile)
+
+    @staticmethod
+    def _node_name(metadata: dict[str, Any]) -> str | None:
+        """The graph node making the call: the first segment of the checkpoint namespace, e.g. `tool_update_todos` of
+        `tool_update_todos:<id>|extract:<id>`, rather than the innermost node reported as `langgraph_node`."""
+        checkpoint_ns = metadata.get('checkpoint_ns') or ''
+        return checkpoint_ns.split('|')[0].split(':')[0] or metadata.get('langgraph_node')
+
+    def _call_backend(
+        self, name: BackendName, given_up: threading.Event, messages: list[BaseMessage], stop: list[str] | None,
+        tools: Sequence[Any] | None, tool_kwargs: dict[str, Any] | None, **kwargs: Any
+    ) -> BaseMessage:
+        model = self.primary if name == 'primary' else self.secondary
+        runnable = model.bind_tools(tools, **(tool_kwargs or {})) if tools else model
+        started = time.monotonic()
+        try:
+            message = runnable.invoke(messages, stop=stop, **kwargs)
+        except Exception:
+            if given_up.is_set():
+                self.metrics.record(name, 'late_failure')
+            else:
+                self._breakers[name].record_failure()
+                self.metrics.record(name, 'failure')
+            raise
+
+        # late answers still count towards the latency percentiles, but no longer decide the breaker's state: the
+        # request has already been timed out or lost to the other backend
+        if given_up.is_set():
+            self.metrics.record(name, 'late_success', time.monotonic() - started)
+        else:
+            self._breakers[name].record_success()
+            self.metrics.record(name, 'success', time.monotonic() - started)
+        return message
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        tools: Sequence[Any] | None = None,
+        tool_kwargs: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        node = self._node_name(run_manager.metadata) if run_manager else None
+        started = time.monotonic()
+        deadline = started + self.node_deadlines.get(node, self.default_deadline)
+
+        pending: dict[Future, BackendName] = dict()
+        candidates: list[BackendName] = ['primary', 'secondary']
+        given_up = threading.Event()
+
+        def submit_next() -> BackendName | None:
+            """Sends the request to the next backend whose circuit breaker lets it through."""
+            while candidates:
+                name = candidates.pop(0)
+                if self._breakers[name].allow_request():
+                    future = self._executors[name].submit(
+                        self._call_backend, name, given_up, messages, stop, tools, tool_kwargs, **kwargs
+                    )
+                    pending[future] = name
+                    return name
+            return None
+
+        if submit_next() is None:
+            raise RuntimeError('All model backends are unavailable: circuit breakers are open')
+        hedge_at = started + self._hedge_delay()
+
+        try:
+            return self._await_answer(pending, candidates, submit_next, hedge_at, deadline, node)
+        finally:
+            given_up.set()
+            for future, name in pending.items():
+                future.cancel()
+                # an abandoned probe no longer reports back: the next request is let through as the probe instead
+                self._breakers[name].release_probe()
+
+    def _await_answer(
+        self, pending: dict[Future, BackendName], candidates: list[BackendName],
+        submit_next: Callable[[], BackendName | None], hedge_at: float, deadline: float, node: str | None,
+    ) -> ChatResult:
+        """Waits for the first answer, hedging and failing over meanwhile; answered requests are removed from `pending`,
+        those left are abandoned by the caller."""
+        error: Exception | None = None
+        while pending:
+            timeout = min(hedge_at if candidates else deadline, deadline) - time.monotonic()
+            done, _ = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    message = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+
+                if pending and name == 'secondary':
+                    self.metrics.record(name, 'hedge_won')
+                return ChatResult(generations=[ChatGeneration(message=message)])
+
+            now = time.monotonic()
+            if candidates and (now >= hedge_at or not pending):
+                outcome = 'hedge' if pending else 'failover'
+                if name := submit_next():
+                    self.metrics.record(name, outcome)
+            elif now >= deadline:
+                for name in pending.values():
+                    self._breakers[name].record_failure()
+                    self.metrics.record(name, 'timeout')
+                raise TimeoutError(f'No model answered within the deadline of node {node}')
+
+        raise error
@@ -0,0 +1,240 @@
+import json
+import logging
+import re
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Sequence
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field
+
+from assistant.models import MemoryType, ToDo, UpdateMemory, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# spellings llama models commonly use instead of the `UpdateMemory.update_type` and `ToDo.status` literals
+UPDATE_TYPE_ALIASES = {
+    'user_profile': MemoryType.USER_PROFILE.value, 'userprofile': MemoryType.USER_PROFILE.value,
+    'profile': MemoryType.USER_PROFILE.value, 'user': MemoryType.USER_PROFILE.value,
+    'todo': MemoryType.TODO.value, 'todos': MemoryType.TODO.value, 'todo_list': MemoryType.TODO.value,
+    'task': MemoryType.TODO.value, 'tasks': MemoryType.TODO.value,
+    'instructions': MemoryType.INSTRUCTIONS.value, 'instruction': MemoryType.INSTRUCTIONS.value,
+    'preferences': MemoryType.INSTRUCTIONS.value,
+}
+STATUS_ALIASES = {
+    'not started': 'not started', 'not_started': 'not started', 'todo': 'not started', 'new': 'not started',
+    'pending': 'not started', 'open': 'not started',
+    'in progress': 'in progress', 'in_progress': 'in progress', 'started': 'in progress', 'ongoing': 'in progress',
+    'done': 'done', 'completed': 'done', 'complete': 'done', 'finished': 'done', 'closed': 'done',
+    'archived': 'archived',
+}
+DEADLINE_FORMATS = ['%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M', '%Y/%m/%d', '%m/%d/%Y %H:%M', '%m/%d/%Y', '%B %d, %Y', '%b %d, %Y']
+# minutes per duration unit; a duration is a sum of terms of an amount and a unit, e.g. `1h30m` or `an hour and 15 min`
+DURATION_UNITS = {
+    'd': 1440, 'day': 1440, 'days': 1440,
+    'h': 60, 'hr': 60, 'hrs': 60, 'hour': 60, 'hours': 60,
+    'm': 1, 'min': 1, 'mins': 1, 'minute': 1, 'minutes': 1,
+}
+DURATION_TERM = re.compile(r'(\d+(?:\.\d+)?|\ban?\b|\bone\b)\s*([a-z]+)')
+DURATION_SEPARATORS = re.compile(r'[\s,]+|\band\b')
+
+
+def _fix_deadline(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    if value.lower() in ('', 'none', 'null', 'n/a'):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        pass
+    for fmt in DEADLINE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).isoformat()
+        except ValueError:
+            continue
+    # an unparseable deadline is dropped, rather than sent back to the model for repair
+    logger.warning('dropped unparseable deadline: %r', value)
+    return None
+
+
+def _fix_minutes(value: Any) -> Any:
+    if isinstance(value, float):
+        return round(value)
+    if not isinstance(value, str):
+        return value
+    text = value.strip().lower()
+    if text in ('', 'none', 'null', 'n/a'):
+        return None
+    try:
+        return round(float(text))  # a bare number is in minutes
+    except ValueError:
+        pass
+    terms = DURATION_TERM.findall(text)
+    rest = DURATION_SEPARATORS.sub('', DURATION_TERM.sub('', text))
+    # anything but known units and separators (e.g. `half an hour`, `2 weeks`) is left for validation to reject
+    if not terms or rest or any(unit not in DURATION_UNITS for _, unit in terms):
+        return value
+    amounts = [1.0 if amount in ('a', 'an', 'one') else float(amount) for amount, _ in terms]
+    return round(sum(amount * DURATION_UNITS[unit] for amount, (_, unit) in zip(amounts, terms)))
+
+
+def _fix_list(value: Any) -> Any:
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return value
+
+
+def _fix_status(value: Any) -> Any:
+    if isinstance(value, str):
+        # unknown statuses are left for validation to reject, rather than reopening the task
+        return STATUS_ALIASES.get(value.strip().lower().replace('-', ' '), value)
+    return value
+
+
+def _fix_update_type(value: Any) -> Any:
+    if isinstance(value, str):
+        return UPDATE_TYPE_ALIASES.get(re.sub(r'[\s-]+', '_', value.strip().lower()), value)
+    return value
+
+
+# field fixers per schema
+FIELD_FIXERS: dict[str, dict[str, Callable[[Any], Any]]] = {
+    UpdateMemory.__name__: {'update_type': _fix_update_type},
+    ToDo.__name__: {
+        'deadline': _fix_deadline,
+        'time_to_complete': _fix_minutes,
+        'solutions': _fix_list,
+        'status': _fix_status,
+    },
+    UserProfile.__name__: {'connections': _fix_list, 'interests': _fix_list},
+}
+
+
+def fix_todo(args: dict[str, Any]) -> dict[str, Any]:
+    """Fills in what the ToDo schema requires but llama models tend to leave out."""
+    args.setdefault('time_to_complete', None)
+    if not args.get('solutions') and args.get('task'):
+        args['solutions'] = [args['task']]
+    return args
+
+
+def fix_tool_call_args(tool_name: str, args: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
+    """
+    Fixes common mistakes in tool call arguments before they are validated, sparing a Trustcall repair round.
+
+    Handles the schemas from `assistant.models` and the values of Trustcall `PatchDoc` patches to them.
+
+    :returns: tuple of the fixed arguments and the names of the fixed fields.
+    """
+    fixed_args = dict(args)
+    if tool_name == 'PatchDoc':
+        fixed_patches, fixes = [], []
+        for patch in fixed_args.get('patches') or []:
+            # fixers apply to whole fields only, not to elements such as `/solutions/0` or `/interests/-`
+            path = str(patch.get('path', ''))
+            field_name = path[1:] if path.startswith('/') and '/' not in path[1:] else None
+            fixer = FIELD_FIXERS[ToDo.__name__].get(field_name) or FIELD_FIXERS[UserProfile.__name__].get(field_name)
+            if fixer and 'value' in patch and (value := fixer(patch['value'])) != patch['value']:
+                patch = {**patch, 'value': value}
+                fixes.append(field_name)
+            fixed_patches.append(patch)
+        fixed_args['patches'] = fixed_patches
+        return fixed_args, fixes
+
+    fixes = []
+    for field_name, fixer in FIELD_FIXERS.get(tool_name, {}).items():
+        if field_name in fixed_args and (value := fixer(fixed_args[field_name])) != fixed_args[field_name]:
+            fixed_args[field_name] = value
+            fixes.append(field_name)
+    if tool_name == ToDo.__name__:
+        before = dict(fixed_args)
+        fixed_args = fix_todo(fixed_args)
+        fixes.extend(name for name in fixed_args if before.get(name, ...) != fixed_args[name])
+    return fixed_args, fixes
+
+
+class SchemaGuardedChatModel(BaseChatModel):
+    """ Chat model wrapper that keeps tool calls valid against their schemas.
+
+    - with `constrained`, a call forced to one of `single_call_tools` is decoded by the inner model with that tool's
+      JSON schema as the output format, provided the inner model supports one (e.g. ChatOllama). This yields a single
+      tool call, hence only tools whose callers expect exactly one qualify: Trustcall also forces e.g. `ToDo` when
+      there are no ToDos yet, yet a message may ask for several
+    - the arguments of every tool call are pre-validated and fixed locally for common mistakes
+    Fixes are counted in `stats`, next to the number of constrained calls and their fallbacks.
+    """
+    inner: BaseChatModel
+    constrained: bool = True
+    # the single User Profile, extracted anew or patched (Trustcall forces PatchDoc only when inserts are off)
+    single_call_tools: frozenset[str] = frozenset({UserProfile.__name__, 'PatchDoc'})
+    stats: Counter = Field(default_factory=Counter)
+
+    @property
+    def _llm_type(self) -> str:
+        return f'schema-guarded-{self.inner._llm_type}'
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        return self.bind(tools=tools, tool_kwargs=kwargs)
+
+    def _constrained_tool(self, tools: Sequence[Any], tool_kwargs: dict[str, Any]) -> dict[str, Any] | None:
+        """Returns the OpenAI spec of the tool the call is forced to, if it can be decoded with a schema instead."""
+        tool_choice = tool_kwargs.get('tool_choice')
+        if not self.constrained or tool_choice not in self.single_call_tools:
+            return None
+        if 'format' not in type(self.inner).model_fields:
+            return None
+        for tool in tools:
+            spec = convert_to_openai_tool(tool)
+            if spec['function']['name'] == tool_choice:
+                return spec
+        return None
+
+    def _invoke_constrained(self, spec: dict[str, Any], messages: list[BaseMessage], stop: list[str] | None, **kwargs: Any) -> AIMessage | None:
+        response = self.inner.invoke(messages, stop=stop, format=spec['function']['parameters'], **kwargs)
+        try:
+            args = json.loads(response.content)
+        except (TypeError, ValueError):
+            self.stats['constrained_fallbacks'] += 1
+            return None
+        self.stats['constrained_calls'] += 1
+        return AIMessage(
+            content='',
+            tool_calls=[{'name': spec['function']['name'], 'args': args, 'id': f'call_{uuid.uuid4().hex}'}],
+            response_metadata=response.response_metadata,
+            usage_metadata=response.usage_metadata,
+        )
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        tools: Sequence[Any] | None = None,
+        tool_kwargs: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = None
+        if tools and (spec := self._constrained_tool(tools, tool_kwargs or {})):
+            message = self._invoke_constrained(spec, messages, stop, **kwargs)
+        if message is None:
+            runnable = self.inner.bind_tools(tools, **(tool_kwargs or {})) if tools else self.inner
+            message = runnable.invoke(messages, stop=stop, **kwargs)
+
+        if getattr(message, 'tool_calls', None):
+            tool_calls = []
+            for tool_call in message.tool_calls:
+                args, fixes = fix_tool_call_args(tool_call['name'], tool_call['args'])
+                if fixes:
+                    logger.info('fixed %s arguments: %s', tool_call['name'], ', '.join(fixes))
+                    self.stats.update(f'fixed:{tool_call["name"]}.{name}' for name in fixes)
+                tool_calls.append({**tool_call, 'args': args})
+            message = message.model_copy(update={'tool_calls': tool_calls})
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -1,31 +1,97 @@
 import os
+from functools import cache, partial
+from typing import Callable
 
-from langchain_ollama import ChatOllama
+from langchain_core.language_models import BaseChatModel
 from langchain_core.rate_limiters import InMemoryRateLimiter
-from langchain_openai import ChatOpenAI
 
+from assistant.resilience import ResilientChatModel
+from assistant.schema_guard import SchemaGuardedChatModel
 from utils.fs_utils import load_api_key
 
-os.environ['OPENAI_API_KEY'] = load_api_key('openai.api_key')
-os.environ['LANGCHAIN_TRACING_V2'] = 'true'
-os.environ['LANGCHAIN_API_KEY'] = load_api_key('langchain.api_key')
-os.environ['LANGCHAIN_PROJECT'] = 'langchain-academy'
+# Deadlines (seconds) of a single LLM call, per inference graph node
+NODE_DEADLINES = {
+    'task_controller': 60.0,
+    'tool_update_user_profile': 90.0,
+    'tool_update_todos': 120.0,
+    'tool_update_memories': 150.0,
+    'tool_update_instructions': 60.0,
+}
+# Request timeout (seconds) of the Ollama client, past the longest node deadline: a request abandoned at its deadline
+# still frees its worker once the timeout expires, rather than waiting on a stalled server indefinitely
+OLLAMA_REQUEST_TIMEOUT = 180.0
 
 
-# Initialize the rate limiter to allow 3 requests per minute
-rate_limiter = InMemoryRateLimiter(
-    requests_per_second=3/60,  # 3 requests per 60 seconds
-    check_every_n_seconds=1,   # Check every second
-    max_bucket_size=3          # Allow bursts of up to 3 requests
-)
+@cache
+def _configure_environment() -> None:
+    """Exports API keys and tracing settings; deferred until the first LLM client is built."""
+    os.environ['OPENAI_API_KEY'] = load_api_key('openai.api_key')
+    os.environ['LANGCHAIN_TRACING_V2'] = 'true'
+    os.environ['LANGCHAIN_API_KEY'] = load_api_key('langchain.api_key')
+    os.environ['LANGCHAIN_PROJECT'] = 'langchain-academy'
+
+
+@cache
+def get_rate_limiter() -> InMemoryRateLimiter:
+    # Initialize the rate limiter to allow 3 requests per minute
+    return InMemoryRateLimiter(
+        requests_per_second=3/60,  # 3 requests per 60 seconds
+        check_every_n_seconds=1,   # Check every second
+        max_bucket_size=3          # Allow bursts of up to 3 requests
+    )
+
+
+def _build_openai(model: str) -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, temperature=0, rate_limiter=get_rate_limiter())
+
+
+def _build_ollama(model: str) -> BaseChatModel:
+    from langchain_ollama import ChatOllama
+    return ChatOllama(model=model, temperature=0, client_kwargs={'timeout': OLLAMA_REQUEST_TIMEOUT})
+
+
+def _build_guarded(inner: str, constrained: bool) -> BaseChatModel:
+    return SchemaGuardedChatModel(inner=get_llm(inner), constrained=constrained)
+
+
+def _build_resilient(primary: str, secondary: str) -> BaseChatModel:
+    return ResilientChatModel(primary=get_llm(primary), secondary=get_llm(secondary), node_deadlines=NODE_DEADLINES)
+
 
 # LLM models
-llm_4o = ChatOpenAI(model='gpt-4o', temperature=0, rate_limiter=rate_limiter)
-llm_4o_mini = ChatOpenAI(model='gpt-4o-mini', temperature=0, rate_limiter=rate_limiter)
-llm_3_5_turbo = ChatOpenAI(model='gpt-3.5-turbo', temperature=0, rate_limiter=rate_limiter)
-llm_o1_mini = ChatOpenAI(model='o1-mini', temperature=0, rate_limiter=rate_limiter)
-
-# ollama run --keepalive 30m llama3.2:3b-instruct-q8_0
-llm_llama3_2_3b = ChatOllama(model='llama3.2:3b-instruct-q8_0', temperature=0)
-# ollama run --keepalive 30m llama3.1:8b-instruct-q8_0
-llm_llama3_1_8b = ChatOllama(model='llama3.1:8b-instruct-q8_0', temperature=0)
\ No newline at end of file
+_MODEL_FACTORIES: dict[str, Callable[[], BaseChatModel]] = {
+    'llm_4o': partial(_build_openai, 'gpt-4o'),
+    'llm_4o_mini': partial(_build_openai, 'gpt-4o-mini'),
+    'llm_3_5_turbo': partial(_build_openai, 'gpt-3.5-turbo'),
+    'llm_o1_mini': partial(_build_openai, 'o1-mini'),
+
+    # ollama run --keepalive 30m llama3.2:3b-instruct-q8_0
+    'llm_llama3_2_3b': partial(_build_ollama, 'llama3.2:3b-instruct-q8_0'),
+    # ollama run --keepalive 30m llama3.1:8b-instruct-q8_0
+    'llm_llama3_1_8b': partial(_build_ollama, 'llama3.1:8b-instruct-q8_0'),
+
+    # local llama with tool call arguments fixed before validation; forced tool calls are decoded with the tool's
+    # JSON schema as the Ollama output format, unless `constrained` is off
+    'llm_llama3_1_8b_guarded': partial(_build_guarded, 'llm_llama3_1_8b', constrained=True),
+    'llm_llama3_1_8b_prevalidated': partial(_build_guarded, 'llm_llama3_1_8b', constrained=False),
+
+    # local llama, hedged to and failed over to gpt-4o-mini
+    'llm_resilient': partial(_build_resilient, 'llm_llama3_1_8b_guarded', 'llm_4o_mini'),
+}
+
+
+@cache
+def get_llm(name: str) -> BaseChatModel:
+    """Returns the named LLM client, constructing it (and its provider package) on first use."""
+    if name not in _MODEL_FACTORIES:
+        raise ValueError(f'Unknown LLM: {name}')
+    _configure_environment()
+    return _MODEL_FACTORIES[name]()
+
+
+def __getattr__(name: str) -> BaseChatModel:
+    # keeps `from assistant.services import llm_4o` working without paying for every client at import time
+    if name in _MODEL_FACTORIES:
+        return get_llm(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
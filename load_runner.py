@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import panel as pn
+from bokeh.document import Document
+from bokeh.util.token import generate_jwt_token, generate_session_id
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from tornado.websocket import websocket_connect
+
+from assistant.app import AssistantApp, PAGE_NAME_CHAT, PAGE_NAME_DETAILS
+from assistant.inf_graph_todo import set_model
+from utils.log_utils import configure_logging
+
+
+class StubChatModel(BaseChatModel):
+    """ Answers instantly and without tool calls, acknowledging the last human message """
+    @property
+    def _llm_type(self) -> str:
+        return 'stub'
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return self
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        last_message = next((m.content for m in reversed(messages) if m.type == 'human'), '')
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f'ack-{last_message}'))])
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (Linux); falls back to the peak RSS elsewhere."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass(kw_only=True)
+class ServerSession:
+    document: Document
+    app: AssistantApp
+    loaded: threading.Event = field(default_factory=threading.Event)
+
+
+class SessionClient:
+    """ Websocket connection of a single Bokeh server session, playing the browser's part """
+    def __init__(self, ws_url: str):
+        self.session_id = generate_session_id()
+        self.ws_url = ws_url
+        self.bytes_received = 0
+        self._expected: dict[str, asyncio.Future] = dict()
+        self._connection = None
+
+    async def connect(self) -> None:
+        self._connection = await websocket_connect(
+            self.ws_url, subprotocols=['bokeh', generate_jwt_token(self.session_id)]
+        )
+        # the server is ready to receive once it has acknowledged the connection
+        for _ in range(3):  # header, metadata and content of the ACK message
+            self.bytes_received += len(await self._connection.read_message())
+        asyncio.get_running_loop().create_task(self._read())
+        await self._send_document_ready()
+
+    async def _send_document_ready(self) -> None:
+        # BokehJS reports a rendered document with this event; Panel only flushes updates of loaded sessions
+        event = {'kind': 'MessageSent', 'msg_type': 'bokeh_event', 'msg_data': {
+            'type': 'event', 'name': 'document_ready', 'values': {'type': 'map', 'entries': []}
+        }}
+        for frame in (
+            {'msgid': generate_session_id(), 'msgtype': 'PATCH-DOC', 'num_buffers': 0},
+            {},
+            {'events': [event]},
+        ):
+            await self._connection.write_message(json.dumps(frame))
+
+    async def _read(self) -> None:
+        while (message := await self._connection.read_message()) is not None:
+            self.bytes_received += len(message)
+            text = message if isinstance(message, str) else message.decode(errors='ignore')
+            for marker in [m for m in self._expected if m in text]:
+                self._expected.pop(marker).set_result(time.monotonic())
+
+    def expect(self, marker: str) -> asyncio.Future:
+        """Resolves, with the time of arrival, once a message containing `marker` is received."""
+        self._expected[marker] = asyncio.get_running_loop().create_future()
+        return self._expected[marker]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+@dataclass(kw_only=True)
+class LoadReport:
+    sessions: int
+    turns: int
+    latencies: list[float] = field(default_factory=list)
+    timeouts: int = 0
+    bytes_per_turn: float = 0.0
+    server_cpu_per_session: float = 0.0
+    server_cpu_per_turn: float = 0.0
+    rss_per_session: float = 0.0
+    rss_growth_per_turn: float = 0.0
+
+    def percentile(self, q: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else float('nan')
+        return statistics.quantiles(self.latencies, n=100)[q - 1]
+
+    def __str__(self) -> str:
+        return '\n'.join([
+            f'sessions: {self.sessions}, turns per session: {self.turns}, timed out turns: {self.timeouts}',
+            f'message latency: p50 {self.percentile(50) * 1000:.0f} ms, p99 {self.percentile(99) * 1000:.0f} ms',
+            f'server CPU: {self.server_cpu_per_session * 1000:.0f} ms per session (setup), '
+            f'{self.server_cpu_per_turn * 1000:.0f} ms per turn',
+            f'server memory: {self.rss_per_session / 2**20:.1f} MB per session, '
+            f'{self.rss_growth_per_turn / 2**10:.0f} KB growth per turn',
+            f'websocket: {self.bytes_per_turn / 2**10:.1f} KB per turn (chat, navigation and Details tabs)',
+        ])
+
+
+class LoadHarness:
+    """ Opens many concurrent sessions of the Panel server and drives their chat and navigation.
+
+    The server runs in-process on a background thread with the LLMs stubbed out. Each session is opened by a
+    websocket client, like a browser would; widget events are injected into the session's document on the
+    server's event loop, and message latency is measured until the AI answer arrives over the websocket.
+    """
+    def __init__(self, sessions: int, turns: int, timeout: float = 60.0):
+        self.n_sessions = sessions
+        self.n_turns = turns
+        self.timeout = timeout
+        self.port = self._free_port()
+        self.server_sessions: dict[str, ServerSession] = dict()
+        self.server = None
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as s:
+            s.bind(('localhost', 0))
+            return s.getsockname()[1]
+
+    def _create_session_app(self) -> pn.Column:
+        session_id = pn.state.curdoc.session_context.id
+        app = AssistantApp(thread_id=session_id)
+        session = ServerSession(document=pn.state.curdoc, app=app)
+        pn.state.onload(session.loaded.set)
+        self.server_sessions[session_id] = session
+        return app.get_dashboard()
+
+    async def _on_server_thread(self, session: ServerSession, fn: Any) -> Any:
+        """Runs `fn` as a next-tick callback of the session's document, i.e. on the server's event loop."""
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+
+        def callback() -> None:
+            value = fn()
+            loop.call_soon_threadsafe(result.set_result, value)
+        session.document.add_next_tick_callback(callback)
+        return await result
+
+    async def _open(self, client: SessionClient) -> ServerSession:
+        await client.connect()
+        while client.session_id not in self.server_sessions or not self.server_sessions[client.session_id].loaded.is_set():
+            await asyncio.sleep(0.05)
+        return self.server_sessions[client.session_id]
+
+    async def _drive(self, client: SessionClient, session: ServerSession, index: int, report: LoadReport) -> None:
+        app = session.app
+        for turn in range(self.n_turns):
+            marker = f'turn{turn}x{index}'
+            answered = client.expect(f'ack-{marker}')
+            started = time.monotonic()
+            await self._on_server_thread(session, lambda: setattr(app.chat_input, 'value', marker))
+            try:
+                report.latencies.append(await asyncio.wait_for(answered, self.timeout) - started)
+            except asyncio.TimeoutError:
+                report.timeouts += 1
+
+            # visit the ToDo memory on the Details page and return to the chat
+            await self._on_server_thread(session, lambda: setattr(app.navigation_bar, 'value', PAGE_NAME_DETAILS))
+            await self._on_server_thread(session, lambda: setattr(app.tabs_details, 'active', 1))
+            await self._on_server_thread(session, lambda: setattr(app.navigation_bar, 'value', PAGE_NAME_CHAT))
+
+    async def _run(self) -> LoadReport:
+        report = LoadReport(sessions=self.n_sessions, turns=self.n_turns)
+        ws_url = f'ws://localhost:{self.port}/ws'
+        clients = [SessionClient(ws_url) for _ in range(self.n_sessions)]
+
+        # an idle session, opened before measuring: it gives access to the server's event loop thread
+        idle_client = SessionClient(ws_url)
+        while True:  # wait for the server to accept connections
+            try:
+                idle_session = await self._open(idle_client)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        rss_started = current_rss_bytes()
+        cpu_started = await self._on_server_thread(idle_session, time.thread_time)
+        sessions = await asyncio.gather(*(self._open(client) for client in clients))
+        cpu_opened = await self._on_server_thread(idle_session, time.thread_time)
+        rss_opened = current_rss_bytes()
+        bytes_opened = sum(client.bytes_received for client in clients)
+
+        await asyncio.gather(*(
+            self._drive(client, session, index, report)
+            for index, (client, session) in enumerate(zip(clients, sessions))
+        ))
+        await asyncio.sleep(1.0)  # let trailing patches arrive
+        cpu_finished = await self._on_server_thread(idle_session, time.thread_time)
+        rss_finished = current_rss_bytes()
+
+        total_turns = self.n_sessions * self.n_turns
+        report.server_cpu_per_session = (cpu_opened - cpu_started) / self.n_sessions
+        report.server_cpu_per_turn = (cpu_finished - cpu_opened) / total_turns
+        report.rss_per_session = (rss_opened - rss_started) / self.n_sessions
+        report.rss_growth_per_turn = (rss_finished - rss_opened) / total_turns
+        report.bytes_per_turn = (sum(client.bytes_received for client in clients) - bytes_opened) / total_turns
+        for client in clients + [idle_client]:
+            client.close()
+        return report
+
+    def run(self) -> LoadReport:
+        set_model(StubChatModel())
+        self.server = pn.serve(
+            self._create_session_app, port=self.port, websocket_origin=['*'], show=False, threaded=True, verbose=False
+        )
+        try:
+            return asyncio.run(self._run())
+        finally:
+            self.server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the AToDo Panel server, with stubbed LLMs')
+    parser.add_argument('--sessions', type=int, default=50, help='number of concurrent browser sessions')
+    parser.add_argument('--turns', type=int, default=5, help='chat messages sent per session')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for an answer')
+    parser.add_argument(
+        '--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='level of the app log: INFO shows prompt tokens per section and Trustcall repair rounds per update'
+    )
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    pn.extension()
+    print(LoadHarness(sessions=args.sessions, turns=args.turns, timeout=args.timeout).run())
@@ -0,0 +1,109 @@
+import uuid
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.graph import END
+
+import assistant.inf_graph_todo
+from assistant.app import MAX_LIVE_MESSAGES, AssistantApp, MockEvent
+from assistant.graph_visualizer import DEFAULT_NODE_COLOR, SOURCE_NODE_COLOR
+from assistant.inf_graph_todo import memory_change_listeners, route_listeners, route_message, set_model
+from assistant.reminders import reminder_listeners
+
+
+class EchoModel(GenericFakeChatModel):
+    """ Replies `r<i>` to the message `m<i>`, never calling a tool """
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.messages = iter([AIMessage(content='r' + messages[-1].content[1:])])
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+@pytest.fixture
+def apps():
+    apps = [AssistantApp(thread_id='a'), AssistantApp(thread_id='b')]
+    yield apps
+    for app in apps:
+        app.on_session_destroyed(None)
+
+
+def test_routes_are_colored_in_the_app_of_their_thread_only(apps):
+    config = {'metadata': {'langgraph_node': 'task_controller'}, 'configurable': {'thread_id': 'a'}}
+    assert route_message({'messages': [AIMessage(content='')]}, config, None) == END
+
+    assert apps[0].graph_visualizer.node_colors['task_controller'] == SOURCE_NODE_COLOR
+    assert apps[1].graph_visualizer.node_colors['task_controller'] == DEFAULT_NODE_COLOR
+
+
+def test_session_destroyed_removes_the_app_listeners(apps):
+    app = apps[0]
+    app.on_session_destroyed(None)
+    assert app.node_colorizer not in route_listeners
+    assert app.memory_editor_refresher not in memory_change_listeners
+    assert app.deadline_reminder not in reminder_listeners
+    assert apps[1].node_colorizer in route_listeners
+
+
+@pytest.fixture
+def chat_app():
+    model = assistant.inf_graph_todo._the_model
+    set_model(EchoModel(messages=iter([])))
+    app = AssistantApp(thread_id=uuid.uuid4().hex)
+    yield app
+    app.on_session_destroyed(None)
+    set_model(model)
+
+
+def chat(app: AssistantApp, turns: range) -> None:
+    for i in turns:
+        app.submit_message_action(MockEvent(name='value', old=None, new=f'm{i}'))
+
+
+def shown(app: AssistantApp) -> list[str]:
+    return [message.object for message in app.chat_feed.objects]
+
+
+def test_feed_keeps_the_latest_messages_live(chat_app):
+    chat(chat_app, range(25))
+    assert len(chat_app.chat_feed.objects) == MAX_LIVE_MESSAGES
+    assert chat_app.history_start == 20
+    assert shown(chat_app)[0] == 'm10' and shown(chat_app)[-1] == 'r24'
+    assert chat_app.btn_load_earlier.visible and not chat_app.btn_load_latest.visible
+
+
+def test_paging_back_to_the_first_message_and_to_the_latest(chat_app):
+    chat(chat_app, range(25))
+    chat_app.load_earlier_messages()
+    assert chat_app.history_start == 10 and shown(chat_app)[0] == 'm5'
+    assert not chat_app.history_at_latest and chat_app.btn_load_latest.visible
+
+    chat_app.load_earlier_messages()
+    assert chat_app.history_start == 0 and shown(chat_app)[0] == 'm0'
+    assert not chat_app.btn_load_earlier.visible
+
+    chat_app.load_latest_messages()
+    assert chat_app.history_start == 20 and shown(chat_app)[-1] == 'r24'
+    assert chat_app.history_at_latest and not chat_app.btn_load_latest.visible
+
+
+def test_message_sent_while_paged_back_returns_to_the_latest(chat_app):
+    chat(chat_app, range(25))
+    chat_app.load_earlier_messages()
+    chat(chat_app, range(25, 26))
+    assert chat_app.history_at_latest
+    assert chat_app.history_start == 22 and shown(chat_app)[-2:] == ['m25', 'r25']
+
+
+def test_retired_reminder_is_not_counted_in_the_history(chat_app):
+    chat(chat_app, range(1))
+    chat_app.append_message('Reminder: Buy rye bread is due', user='reminder')
+    chat(chat_app, range(1, 16))
+
+    # m0, r0 and the reminder are retired; only the former two are part of the transcript
+    assert chat_app.history_start == 2
+    assert shown(chat_app)[0] == 'm1'
+    chat_app.load_earlier_messages()
+    assert shown(chat_app)[:3] == ['m0', 'r0', 'm1']
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+from langgraph.store.memory import InMemoryStore
+
+from assistant.dedup import (
+    MinHashIndex, dedup_namespace, deduplicate_todo, get_todo_index, index_todo, iter_items, jaccard, merge_todos,
+    shingles
+)
+
+NAMESPACE = ('todo', 'general', 'user')
+
+
+def todo(task: str, **fields) -> dict:
+    return {
+        'task': task, 'time_to_complete': None, 'deadline': None, 'solutions': [task], 'status': 'not started', **fields
+    }
+
+
+@pytest.fixture
+def store():
+    return InMemoryStore()
+
+
+def put(store: InMemoryStore, key: str, value: dict) -> None:
+    store.put(NAMESPACE, key, value)
+    index_todo(store, NAMESPACE, key, value)
+
+
+def test_shingles_drop_stopwords_and_case():
+    assert shingles('Buy some Rye bread at the store') == {'buy', 'rye', 'bread', 'store'}
+    assert shingles('To the') == {'to', 'the'}
+
+
+def test_index_finds_near_duplicates_only():
+    index = MinHashIndex()
+    index.add('a', 'Buy rye bread')
+    index.add('b', 'Upload AToDo agentic app to Github')
+    assert [key for key, _ in index.query('buy rye bread at Whole Foods')] == ['a']
+    assert index.query('Register for Friends Of Trees event') == []
+
+    index.add('a', 'Call mom')
+    assert index.query('Buy rye bread') == []
+    index.remove('b')
+    assert len(index) == 1
+
+
+def test_index_recall_at_threshold():
+    # tasks of 4 shared and 4 distinct words have a Jaccard similarity of exactly the 0.5 threshold
+    rng = random.Random(0)
+    vocabulary = [f'word{i}' for i in range(10_000)]
+    found = 0
+    for trial in range(200):
+        words = rng.sample(vocabulary, 8)
+        index = MinHashIndex()
+        index.add('k', ' '.join(words[:6]))
+        found += bool(index.query(' '.join(words[:4] + words[6:])))
+    assert found / 200 > 0.75
+
+
+def test_default_flags_without_merging(store):
+    put(store, 'a', todo('Buy rye bread'))
+    key, value, duplicate_of = deduplicate_todo(store, NAMESPACE, todo('Buy rye bread at Whole Foods'), 'flag')
+    assert (key, duplicate_of) == (None, 'a')
+    assert value['task'] == 'Buy rye bread at Whole Foods'
+
+
+@pytest.mark.parametrize('existing_task, new_task', [
+    ('Renew car insurance', 'Renew home insurance'),
+    ('Buy rye bread', 'Buy white bread'),
+])
+def test_distinct_tasks_at_threshold_are_flagged_not_merged(store, existing_task, new_task):
+    assert jaccard(shingles(existing_task), shingles(new_task)) == 0.5
+    put(store, 'a', todo(existing_task))
+    key, value, duplicate_of = deduplicate_todo(store, NAMESPACE, todo(new_task), 'merge')
+    assert (key, duplicate_of) == (None, 'a')
+    assert value['task'] == new_task
+    assert store.get(NAMESPACE, 'a').value['task'] == existing_task
+
+
+def test_more_specific_task_is_merged(store):
+    put(store, 'a', todo('Buy rye bread', status='in progress', time_to_complete=15))
+    key, value, duplicate_of = deduplicate_todo(
+        store, NAMESPACE, todo('Buy rye bread at Whole Foods', solutions=['Whole Foods']), 'merge'
+    )
+    assert key == duplicate_of == 'a'
+    assert value == todo(
+        'Buy rye bread at Whole Foods', status='in progress', time_to_complete=15,
+        solutions=['Buy rye bread', 'Whole Foods'],
+    )
+
+
+def test_closed_and_unrelated_todos_are_not_duplicates(store):
+    put(store, 'a', todo('Buy rye bread', status='done'))
+    put(store, 'b', todo('Call mom'))
+    assert deduplicate_todo(store, NAMESPACE, todo('Buy rye bread'), 'merge')[2] is None
+    assert deduplicate_todo(store, NAMESPACE, todo('Buy rye bread'), 'off')[2] is None
+
+
+def test_todo_changed_behind_the_index_is_not_matched(store):
+    put(store, 'a', todo('Buy rye bread'))
+    store.put(NAMESPACE, 'a', todo('Call mom'))
+    assert deduplicate_todo(store, NAMESPACE, todo('Buy rye bread'), 'flag')[2] is None
+    store.delete(NAMESPACE, 'a')
+    assert deduplicate_todo(store, NAMESPACE, todo('Call mom'), 'flag')[2] is None
+    assert len(get_todo_index(store, NAMESPACE)) == 0
+
+
+def test_merge_keeps_set_fields_and_existing_task():
+    existing = todo('Buy rye bread at Whole Foods', status='in progress', deadline='2026-11-02T00:00:00')
+    merged = merge_todos(existing, todo('Buy rye bread', time_to_complete=10))
+    assert merged['task'] == 'Buy rye bread at Whole Foods'
+    assert merged['status'] == 'in progress'
+    assert merged['deadline'] == '2026-11-02T00:00:00'
+    assert merged['time_to_complete'] == 10
+
+
+def test_index_is_built_by_paging_through_the_store(store):
+    for i in range(25):
+        store.put(NAMESPACE, f'k{i}', todo(f'task{i} errand{i}'))
+    assert len(list(iter_items(store, NAMESPACE, page_size=10))) == 25
+    assert len(get_todo_index(store, NAMESPACE)) == 25
+
+
+def test_dedup_namespace_merges_into_oldest(store):
+    store.put(NAMESPACE, 'a', todo('Buy rye bread'))
+    store.put(NAMESPACE, 'b', todo('Renew car insurance'))
+    store.put(NAMESPACE, 'c', todo('Buy rye bread at Whole Foods'))
+    store.put(NAMESPACE, 'd', todo('Renew home insurance'))
+    store.put(NAMESPACE, 'e', todo('Buy some rye bread', status='done'))
+
+    assert dedup_namespace(store, NAMESPACE) == {'c': 'a'}
+    assert store.get(NAMESPACE, 'a').value['task'] == 'Buy rye bread at Whole Foods'
+    assert {item.key for item in iter_items(store, NAMESPACE)} == {'a', 'b', 'd', 'e'}
@@ -0,0 +1,9 @@
+from assistant.inf_graph_todo import fold_profile
+
+
+def test_fold_profile_unites_list_fields():
+    existing = {'name': 'Dan', 'location': 'Beaverton', 'job': None, 'connections': ['Ann'], 'interests': ['biking']}
+    new = {'name': None, 'location': 'Portland', 'job': None, 'connections': [], 'interests': ['hiking', 'biking']}
+    assert fold_profile(existing, new) == {
+        'name': 'Dan', 'location': 'Portland', 'job': None, 'connections': ['Ann'], 'interests': ['biking', 'hiking']
+    }
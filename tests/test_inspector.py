@@ -0,0 +1,83 @@
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from assistant.inspector import ToolInvocationInspector, format_change_events
+
+
+def llm_result(*tool_calls: dict) -> LLMResult:
+    message = AIMessage(content='', tool_calls=[
+        {'name': name, 'args': args, 'id': call_id} for name, args, call_id in tool_calls
+    ])
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def patch_doc(doc_id: str, value: str | None = None) -> tuple[str, dict, str]:
+    patches = [{'op': 'replace', 'path': '/task', 'value': value}] if value else []
+    return 'PatchDoc', {'json_doc_id': doc_id, 'planned_edits': f'edit {doc_id}', 'patches': patches}, f'p-{doc_id}'
+
+
+def test_new_update_and_no_update_events():
+    spy = ToolInvocationInspector(schema_names=('ToDo',))
+    spy.on_llm_end(llm_result(
+        ('ToDo', {'task': 'Buy rye bread'}, 'call-1'),
+        patch_doc('doc-1', 'Call mom today'),
+        patch_doc('doc-2'),
+    ))
+
+    events = {event.type: event for event in spy.events}
+    assert events.keys() == {'new', 'update', 'no_update'}
+    assert events['new'].schema_name == 'ToDo' and events['new'].value == {'task': 'Buy rye bread'}
+    assert events['update'].doc_id == 'doc-1' and events['update'].value == 'Call mom today'
+    assert events['no_update'].doc_id == 'doc-2' and events['no_update'].planned_edits == 'edit doc-2'
+    assert spy.repair_rounds == 0
+
+
+def test_empty_patch_does_not_overwrite_an_earlier_update():
+    spy = ToolInvocationInspector(schema_names=('ToDo',))
+    spy.on_llm_end(llm_result(patch_doc('doc-1', 'Call mom today')))
+    spy.on_llm_end(llm_result(patch_doc('doc-1')))
+
+    assert [(event.type, event.value) for event in spy.events] == [('update', 'Call mom today')]
+
+
+def test_repair_rounds_are_counted_but_not_events():
+    spy = ToolInvocationInspector(schema_names=('ToDo',))
+    spy.on_llm_end(llm_result(('ToDo', {'task': 'Buy rye bread'}, 'call-1')))
+    spy.on_llm_end(llm_result(('PatchFunctionErrors', {'json_doc_id': 'call-1', 'patches': []}, 'r-1')))
+    spy.on_llm_end(llm_result(('PatchFunctionName', {'json_doc_id': 'call-1', 'reasoning': ''}, 'r-2')))
+
+    assert spy.repair_rounds == 2
+    assert len(spy.events) == 1
+
+
+def test_ignores_results_without_tool_calls():
+    spy = ToolInvocationInspector()
+    spy.on_llm_end(LLMResult(generations=[]))
+    spy.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content='hi'))]]))
+    assert spy.events == [] and spy.repair_rounds == 0
+
+
+def test_resolve_by_call_id_then_by_doc_id():
+    spy = ToolInvocationInspector(schema_names=('ToDo', 'UserProfile'))
+    spy.on_llm_end(llm_result(('ToDo', {'task': 'buy rye bread'}, 'call-1'), patch_doc('doc-2', 'Call mom')))
+
+    new = spy.resolve(call_id='call-1', doc_id='doc-1', value={'task': 'Buy rye bread'})
+    assert new.doc_id == 'doc-1' and new.value == {'task': 'Buy rye bread'} and new.schema_name == 'ToDo'
+
+    # a patched document is found by its id, as the tool call id in Trustcall metadata is not the PatchDoc's
+    updated = spy.resolve(call_id='unknown', doc_id='doc-2', value={'task': 'Call mom'}, schema_name='ToDo')
+    assert updated.type == 'update' and updated.value == {'task': 'Call mom'} and updated.schema_name == 'ToDo'
+
+    assert spy.resolve(call_id='unknown', doc_id='doc-3', value={}) is None
+
+
+def test_format_change_events():
+    spy = ToolInvocationInspector(schema_names=('ToDo',))
+    spy.on_llm_end(llm_result(('ToDo', {'task': 'Buy rye bread'}, 'call-1'), patch_doc('doc-2')))
+    spy.resolve(call_id='call-1', doc_id='doc-1', value={'task': 'Buy rye bread'})
+    spy.events[0].duplicate_of = 'doc-0'
+
+    assert format_change_events(spy.events, 'ToDo') == (
+        "New ToDo created:\nContent: {'task': 'Buy rye bread'}\nPossible duplicate of document doc-0"
+        '\n\nDocument doc-2 unchanged:\nedit doc-2'
+    )
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from assistant.prompt_serializer import (
+    count_tokens, format_relative_date, serialize_profile, serialize_todos, serialize_instructions
+)
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+
+def todo(task: str, **fields) -> dict:
+    return {'task': task, 'time_to_complete': None, 'deadline': None, 'solutions': [], 'status': 'not started', **fields}
+
+
+def test_count_tokens_splits_words_and_punctuation():
+    assert count_tokens('Buy rye bread.') == 4
+    assert count_tokens('') == 0
+
+
+def test_format_relative_date():
+    assert format_relative_date('2026-10-19T10:00', NOW) == 'overdue 2h'
+    assert format_relative_date('2026-10-17T12:00', NOW) == 'overdue 2d'
+    assert format_relative_date('2026-10-19T17:30', NOW) == 'today 17:30'
+    assert format_relative_date('2026-10-20T09:00', NOW) == 'tomorrow 09:00'
+    assert format_relative_date('2026-11-18T09:00', NOW) == 'Nov 18'
+    assert format_relative_date('2027-01-02T09:00', NOW) == '2027-01-02'
+
+
+def test_serialize_profile_drops_empty_fields():
+    profile = {'name': 'Dan', 'location': None, 'job': None, 'connections': [], 'interests': ['biking', 'hiking']}
+    assert serialize_profile(profile) == 'name: Dan\ninterests: biking, hiking'
+    assert serialize_profile(None) == ''
+
+
+def test_serialize_todos_drops_columns_empty_or_default_in_every_row():
+    table = serialize_todos([todo('Buy rye bread', solutions=['Whole Foods']), todo('Call mom')], NOW)
+    assert table == 'task | solutions\nBuy rye bread | Whole Foods\nCall mom | '
+
+
+def test_serialize_todos_spells_out_default_status_in_kept_column():
+    table = serialize_todos([todo('Buy rye bread', status='done'), todo('Call mom')], NOW)
+    assert table == 'task | status\nBuy rye bread | done\nCall mom | not started'
+
+
+def test_serialize_todos_escapes_separators_and_shortens_deadlines():
+    table = serialize_todos([todo('Plan a|b\ntrip', deadline='2026-10-20T09:00:00', time_to_complete=30)], NOW)
+    assert table == 'task | minutes | deadline\nPlan a/b trip | 30 | tomorrow 09:00'
+
+
+def test_serialize_instructions_collapses_whitespace():
+    assert serialize_instructions({'memory': '  Be   brief.\n\n\t Use lists. '}) == 'Be brief.\nUse lists.'
+    assert serialize_instructions(None) == ''
@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from assistant.reminders import DeadlineScheduler, ReminderListener, reminder_listeners
+
+NAMESPACE = ('todo', 'general', 'user')
+
+
+class Recorder(ReminderListener):
+    def __init__(self):
+        self.keys = []
+        self.fired = threading.Event()
+
+    def update(self, namespace=None, key=None, task=None, deadline=None) -> None:
+        self.keys.append(key)
+        self.fired.set()
+
+
+@pytest.fixture
+def recorder():
+    recorder = Recorder()
+    reminder_listeners.add(recorder)
+    yield recorder
+    reminder_listeners.discard(recorder)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = DeadlineScheduler()
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+
+
+def todo(deadline: datetime | None, status: str = 'not started') -> dict:
+    return {'task': 'Buy rye bread', 'deadline': deadline and deadline.isoformat(), 'status': status}
+
+
+def test_overdue_todo_fires_once(scheduler, recorder):
+    overdue = todo(datetime.now() - timedelta(minutes=5))
+    scheduler.schedule(NAMESPACE, 'k', overdue)
+    assert recorder.fired.wait(2)
+
+    # patching the overdue ToDo again must not repeat its reminder
+    scheduler.schedule(NAMESPACE, 'k', overdue)
+    time.sleep(0.2)
+    assert recorder.keys == ['k']
+    assert len(scheduler) == 0
+
+
+def test_rescheduled_todo_fires_for_its_new_deadline(scheduler, recorder):
+    scheduler.schedule(NAMESPACE, 'k', todo(datetime.now() - timedelta(minutes=5)))
+    assert recorder.fired.wait(2)
+    recorder.fired.clear()
+    scheduler.schedule(NAMESPACE, 'k', todo(datetime.now() + timedelta(seconds=0.2)))
+    assert recorder.fired.wait(2)
+    assert recorder.keys == ['k', 'k']
+
+
+def test_closed_or_undated_todos_are_not_scheduled(scheduler, recorder):
+    scheduler.schedule(NAMESPACE, 'a', todo(datetime.now() + timedelta(hours=1)))
+    scheduler.schedule(NAMESPACE, 'a', todo(datetime.now() + timedelta(hours=1), status='done'))
+    scheduler.schedule(NAMESPACE, 'b', todo(None))
+    assert len(scheduler) == 0
+
+
+def test_reminders_fire_in_deadline_order(scheduler, recorder):
+    now = datetime.now()
+    for key, seconds in [('late', 0.3), ('early', 0.1), ('middle', 0.2)]:
+        scheduler.schedule(NAMESPACE, key, todo(now + timedelta(seconds=seconds)))
+    deadline = time.monotonic() + 2
+    while len(recorder.keys) < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert recorder.keys == ['early', 'middle', 'late']
+
+
+def test_cancel_and_reschedule_forget_fired_deadlines(scheduler, recorder):
+    overdue = todo(datetime.now() - timedelta(minutes=5))
+    scheduler.schedule(NAMESPACE, 'k', overdue)
+    assert recorder.fired.wait(2)
+    assert scheduler._fired
+
+    scheduler.cancel(NAMESPACE, 'k')
+    assert not scheduler._fired
+
+    scheduler.schedule(NAMESPACE, 'k', overdue)  # reopened: reminds again
+    deadline = time.monotonic() + 2
+    while len(recorder.keys) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert recorder.keys == ['k', 'k']
+    scheduler.schedule(NAMESPACE, 'k', todo(datetime.now() + timedelta(hours=1)))
+    assert not scheduler._fired and len(scheduler) == 1
@@ -0,0 +1,152 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from assistant.resilience import CircuitBreaker, LatencyMetrics, ResilientChatModel
+
+
+class Backend(GenericFakeChatModel):
+    """ Answers with its name after a delay, or fails """
+    delay: float = 0.0
+    fail: bool = False
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, *args, **kwargs):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('backend down')
+        return super()._generate(*args, **kwargs)
+
+
+def backend(name: str, **kwargs) -> Backend:
+    def answers():
+        while True:
+            yield AIMessage(content=name)
+    return Backend(messages=answers(), **kwargs)
+
+
+def test_circuit_breaker_opens_and_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request() and breaker.state == 'half_open'
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_latency_metrics_percentiles():
+    metrics = LatencyMetrics()
+    for latency in range(1, 101):
+        metrics.record('primary', 'success', latency / 100)
+    assert metrics.sample_count('primary') == 100
+    assert metrics.percentile('primary', 0.5) == pytest.approx(0.51)
+    assert metrics.snapshot()['primary']['success'] == 100
+
+
+def test_slow_primary_is_hedged_to_secondary():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=0.5), secondary=backend('secondary'), default_hedge_delay=0.05
+    )
+    assert model.invoke('hi').content == 'secondary'
+    snapshot = model.metrics.snapshot()
+    assert snapshot['secondary']['hedge'] == 1 and snapshot['secondary']['hedge_won'] == 1
+
+
+def test_primary_beating_its_hedge_is_not_a_hedge_win():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=0.1), secondary=backend('secondary', delay=0.5), default_hedge_delay=0.05
+    )
+    assert model.invoke('hi').content == 'primary'
+    snapshot = model.metrics.snapshot()
+    assert 'hedge_won' not in snapshot['primary']
+    assert 'hedge_won' not in snapshot.get('secondary', {})
+
+
+def test_failing_primary_fails_over_and_opens_its_breaker():
+    model = ResilientChatModel(primary=backend('primary', fail=True), secondary=backend('secondary'))
+    for _ in range(3):
+        assert model.invoke('hi').content == 'secondary'
+    assert model._breakers['primary'].state == 'open'
+
+    # the open breaker routes straight to the secondary
+    assert model.invoke('hi').content == 'secondary'
+    assert model.metrics.snapshot()['primary']['failure'] == 3
+
+
+def test_deadline_is_enforced():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=1.0), secondary=backend('secondary', delay=1.0),
+        default_hedge_delay=0.05, default_deadline=0.2,
+    )
+    with pytest.raises(TimeoutError):
+        model.invoke('hi')
+
+
+def test_deadline_is_that_of_the_outer_graph_node():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=0.5), secondary=backend('secondary', delay=0.5),
+        node_deadlines={'tool_update_todos': 0.1}, default_hedge_delay=0.05,
+    )
+    metadata = {'checkpoint_ns': 'tool_update_todos:1f0e|extract:2a4b', 'langgraph_node': 'extract'}
+    assert ResilientChatModel._node_name(metadata) == 'tool_update_todos'
+    assert ResilientChatModel._node_name({'langgraph_node': 'task_controller'}) == 'task_controller'
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError, match='tool_update_todos'):
+        model.invoke('hi', config={'metadata': metadata})
+    assert time.monotonic() - started < 0.4
+
+
+def test_late_answers_leave_the_breakers_alone():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=0.2), secondary=backend('secondary', delay=0.2),
+        default_hedge_delay=0.0, default_deadline=0.1,
+    )
+    for name in ('primary', 'secondary'):
+        model._breakers[name] = CircuitBreaker(failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        model.invoke('hi')
+    time.sleep(0.3)
+
+    assert [breaker.state for breaker in model._breakers.values()] == ['open', 'open']
+    snapshot = model.metrics.snapshot()
+    assert snapshot['primary']['timeout'] == snapshot['primary']['late_success'] == 1
+    assert 'success' not in snapshot['primary']
+    assert model.metrics.sample_count('primary') == 1
+
+
+class HoldingExecutor(ThreadPoolExecutor):
+    """ Never starts requests, as if they were queued behind busy workers """
+    def submit(self, fn, *args, **kwargs) -> Future:
+        return Future()
+
+
+def test_abandoned_probe_does_not_leave_its_breaker_half_open():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=0.2), secondary=backend('secondary'), default_hedge_delay=0.05
+    )
+    model._executors['secondary'] = HoldingExecutor()
+    breaker = model._breakers['secondary'] = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert model.invoke('hi').content == 'primary'
+    assert breaker.state == 'open'
+    assert breaker.allow_request()
+
+
+def test_stalled_primary_does_not_starve_the_secondary():
+    model = ResilientChatModel(
+        primary=backend('primary', delay=10.0), secondary=backend('secondary'), default_hedge_delay=0.0
+    )
+    model._executors['primary'] = HoldingExecutor()
+    assert model.invoke('hi').content == 'secondary'
@@ -0,0 +1,125 @@
+import json
+from typing import Any
+
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from assistant.models import ToDo, UpdateMemory, UserProfile
+from assistant.schema_guard import SchemaGuardedChatModel, _fix_minutes, fix_tool_call_args
+
+
+class FakeOllama(BaseChatModel):
+    """ Answers with JSON when given an output format, with a malformed ToDo tool call otherwise """
+    format: Any = None
+    formats: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-ollama'
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(**kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, format=None, **kwargs) -> ChatResult:
+        self.formats.append(format)
+        if format is not None:
+            message = AIMessage(content=json.dumps({'name': 'Dan', 'interests': 'biking, hiking'}))
+        else:
+            message = AIMessage(content='', tool_calls=[
+                {'name': 'ToDo', 'args': {'task': 'Buy rye bread', 'status': 'Completed'}, 'id': 't1'},
+                {'name': 'ToDo', 'args': {'task': 'Call mom', 'time_to_complete': '1 hour'}, 'id': 't2'},
+            ])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_fix_todo_arguments():
+    args, fixes = fix_tool_call_args('ToDo', {
+        'task': 'Buy rye bread', 'deadline': '2026/11/02', 'time_to_complete': '30 minutes', 'status': 'In-Progress',
+        'solutions': [],
+    })
+    assert args == {
+        'task': 'Buy rye bread', 'deadline': '2026-11-02T00:00:00', 'time_to_complete': 30, 'status': 'in progress',
+        'solutions': ['Buy rye bread'],
+    }
+    assert set(fixes) == {'deadline', 'time_to_complete', 'status', 'solutions'}
+    ToDo(**args)
+
+
+def test_unknown_status_is_left_for_validation():
+    args, fixes = fix_tool_call_args('ToDo', {'task': 'Renew passport', 'status': 'blocked', 'solutions': ['x']})
+    assert args['status'] == 'blocked'
+    assert 'status' not in fixes
+
+
+def test_unparseable_deadline_is_dropped_and_logged(caplog):
+    args, _ = fix_tool_call_args('ToDo', {'task': 'Renew passport', 'deadline': 'next-ish', 'solutions': ['x']})
+    assert args['deadline'] is None
+    assert 'next-ish' in caplog.text
+
+
+@pytest.mark.parametrize('value, minutes', [
+    ('30 minutes', 30), ('45', 45), (12.6, 13), (20, 20), ('1h30m', 90), ('1 hour and 30 minutes', 90),
+    ('1.5 hours', 90), ('2 days', 2880), ('an hour', 60), ('1 day, 2 hours', 1560), ('null', None),
+])
+def test_fix_durations(value, minutes):
+    assert _fix_minutes(value) == minutes
+
+
+@pytest.mark.parametrize('value', ['2 weeks', 'half an hour', 'about 2 hours', 'soon'])
+def test_unknown_durations_are_left_for_validation(value):
+    assert _fix_minutes(value) == value
+
+
+def test_fix_update_type_and_patch_values():
+    assert fix_tool_call_args('UpdateMemory', {'update_type': 'ToDo'})[0] == {'update_type': 'todo'}
+    args, fixes = fix_tool_call_args('PatchDoc', {'json_doc_id': 'k', 'planned_edits': '', 'patches': [
+        {'op': 'replace', 'path': '/status', 'value': 'finished'},
+        {'op': 'replace', 'path': '/deadline', 'value': 'null'},
+    ]})
+    assert [patch['value'] for patch in args['patches']] == ['done', None]
+    assert fixes == ['status', 'deadline']
+
+
+def test_patched_list_elements_are_left_alone():
+    patches = [
+        {'op': 'add', 'path': '/interests/-', 'value': 'hiking, biking'},
+        {'op': 'replace', 'path': '/solutions/0', 'value': 'Whole Foods'},
+        {'op': 'replace', 'path': '/solutions', 'value': 'Whole Foods, Trader Joe\'s'},
+        {'op': 'replace', 'path': '/time_to_complete', 'value': '1h30m'},
+    ]
+    args, fixes = fix_tool_call_args('PatchDoc', {'json_doc_id': 'k', 'planned_edits': '', 'patches': patches})
+    assert [patch['value'] for patch in args['patches']] == [
+        'hiking, biking', 'Whole Foods', ['Whole Foods', "Trader Joe's"], 90
+    ]
+    assert fixes == ['solutions', 'time_to_complete']
+
+
+def test_single_profile_call_is_decoded_with_its_schema():
+    inner = FakeOllama(formats=[])
+    model = SchemaGuardedChatModel(inner=inner)
+    message = model.bind_tools([UserProfile], tool_choice='UserProfile').invoke([HumanMessage('I am Dan')])
+    assert inner.formats[0]['properties'].keys() == UserProfile.model_json_schema()['properties'].keys()
+    assert [call['name'] for call in message.tool_calls] == ['UserProfile']
+    assert message.tool_calls[0]['args'] == {'name': 'Dan', 'interests': ['biking', 'hiking']}
+    assert model.stats['constrained_calls'] == 1
+
+
+def test_forced_todo_call_keeps_all_tool_calls():
+    inner = FakeOllama(formats=[])
+    model = SchemaGuardedChatModel(inner=inner)
+    message = model.bind_tools([ToDo], tool_choice='ToDo').invoke([HumanMessage('buy bread and call mom')])
+    assert inner.formats == [None]
+    assert [call['args']['task'] for call in message.tool_calls] == ['Buy rye bread', 'Call mom']
+    assert message.tool_calls[0]['args']['status'] == 'done'
+    assert message.tool_calls[1]['args']['time_to_complete'] == 60
+    for call in message.tool_calls:
+        ToDo(**call['args'])
+
+
+def test_unconstrained_guard_only_fixes_arguments():
+    inner = FakeOllama(formats=[])
+    model = SchemaGuardedChatModel(inner=inner, constrained=False)
+    model.bind_tools([UserProfile, UpdateMemory], tool_choice='UserProfile').invoke([HumanMessage('I am Dan')])
+    assert inner.formats == [None]
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# heavy optional packages, loaded on first use rather than on import of the graph module
+LAZY_MODULES = ['trustcall', 'langchain_openai', 'langchain_ollama', 'pyvis', 'networkx']
+
+
+def test_graph_module_import_does_not_load_heavy_packages():
+    script = (
+        'import sys, assistant.inf_graph_todo; '
+        f'print(",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True, check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+    assert result.stdout.strip() == ''
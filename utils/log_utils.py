@@ -0,0 +1,13 @@
+import logging
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def configure_logging(level: str = 'INFO') -> None:
+    """
+    Shows the app's own log records (prompt token and Trustcall repair round counts, tool call fixes) at `level`.
+
+    Third-party libraries stay at WARNING, so their per-request records do not drown the app's.
+    """
+    logging.basicConfig(format=LOG_FORMAT, level=logging.WARNING)
+    logging.getLogger('assistant').setLevel(level)
@@ -0,0 +1,87 @@
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+# matches lines of `python -X importtime`: "import time:  self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+@dataclass(kw_only=True)
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def profile_imports(module_name: str) -> list[ImportTiming]:
+    """
+    Imports `module_name` in a fresh interpreter with `-X importtime` and parses the per-module costs.
+
+    A subprocess is used so that the measurement reflects a cold start, unaffected by
+    modules already loaded into the calling process.
+
+    :returns: list of ImportTiming, one per imported module, in the order they were imported.
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        capture_output=True, text=True, check=True
+    )
+    timings = []
+    for line in completed.stderr.splitlines():
+        if match := IMPORTTIME_LINE.match(line):
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(ImportTiming(
+                module=module, self_us=int(self_us), cumulative_us=int(cumulative_us), depth=len(indent) // 2
+            ))
+    return timings
+
+
+class StartupProfiler:
+    """ Collects import and initialization costs of the application's startup path """
+    def __init__(self):
+        self.import_timings: dict[str, list[ImportTiming]] = dict()
+        self.init_timings: list[tuple[str, float]] = []
+
+    def profile_imports(self, module_name: str) -> None:
+        self.import_timings[module_name] = profile_imports(module_name)
+
+    @contextmanager
+    def measure(self, step_name: str) -> Iterator[None]:
+        """Records wall-clock time of an initialization step."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.init_timings.append((step_name, time.perf_counter() - started))
+
+    def report(self, top_n: int = 15, own_packages: tuple[str, ...] = ('assistant', 'utils')) -> str:
+        lines = []
+        for module_name, timings in self.import_timings.items():
+            total_us = sum(t.self_us for t in timings)
+            lines.append(f'Cold import of {module_name}: {total_us / 1000:.1f} ms over {len(timings)} modules')
+
+            # third-party cost is attributed to the top-level package that owns each module
+            package_us: dict[str, int] = dict()
+            for t in timings:
+                package = t.module.split('.')[0]
+                package_us[package] = package_us.get(package, 0) + t.self_us
+            lines.append('  by package (self time):')
+            for package, self_us in sorted(package_us.items(), key=lambda item: item[1], reverse=True)[:top_n]:
+                lines.append(f'    {self_us / 1000:10.1f} ms  {package}')
+
+            # project modules are reported with cumulative time, i.e. including what they pull in
+            lines.append('  project modules (cumulative):')
+            for t in timings:
+                if t.module.split('.')[0] in own_packages:
+                    lines.append(f'    {t.cumulative_us / 1000:10.1f} ms  {t.module}')
+            lines.append('')
+
+        lines.append('Initialization:')
+        for step_name, elapsed in self.init_timings:
+            lines.append(f'  {elapsed * 1000:10.1f} ms  {step_name}')
+        return '\n'.join(lines)